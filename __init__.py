@@ -16,19 +16,24 @@ limitations under the License.
 
 This file has been modified from its original version.
 """
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 import functools
 import glob
+import hashlib
 import json
+import math
 import os
+import re
 import shutil
 import subprocess
 import tempfile
 import threading
+import time
 import urllib
 import urllib.parse
 from uuid import UUID
 
+import numpy as np
 import requests
 
 import bpy
@@ -39,6 +44,10 @@ from bpy.props import (StringProperty,
                        IntProperty,
                        PointerProperty)
 
+from . import gltf_utils
+from . import image_utils
+from . import zip_stream
+
 bl_info = {
     'name': 'Icosa Gallery Addon',
     'description': 'Browse, download from and publish to the Icosa 3D models Gallery',
@@ -91,6 +100,17 @@ def _get_addon_preferences():
         pass
     return None
 
+# Preference values replacing those of the add-on preferences,
+# used when running without them (e.g. headless batch imports)
+preference_overrides = {}
+
+
+def get_preference(name, default=None):
+    if name in preference_overrides:
+        return preference_overrides[name]
+    return getattr(_get_addon_preferences(), name, default)
+
+
 class Config:
 
     ADDON_NAME = 'io_icosa_gallery'
@@ -125,6 +145,9 @@ class Config:
     ICOSA_TEMP_DIR = ""
     ICOSA_THUMB_DIR = ""
     ICOSA_MODEL_DIR = ""
+    ICOSA_BLEND_CACHE_DIR = ""
+    ICOSA_PROXY_DIR = ""
+    ICOSA_UPLOAD_DIR = ""
 
     ICOSA_CATEGORIES = (
         ('ALL', 'All categories', 'All categories'),
@@ -178,9 +201,34 @@ class Config:
 
     MAX_THUMBNAIL_HEIGHT = 256
 
+    # Number of objects or material slots processed between two import events
+    IMPORT_CHUNK_SIZE = 200
+    IMPORT_STAGE_INTERVAL = 0.01
+
+    # Decimation never goes below this ratio, whatever the triangle budget
+    MIN_DECIMATE_RATIO = 0.01
+
     ICOSA_UPLOAD_LIMITS = {
         "basic": 100 * 1024 * 1024,
     }
+    # Diagnostics of the last uploads kept in the cache
+    UPLOAD_HISTORY_LENGTH = 20
+    UPLOAD_ATTEMPTS = 5
+    # Seconds before the first retry, doubled for each of the next ones
+    UPLOAD_RETRY_DELAY = 2
+    # Seconds to connect, and to wait for the response once the package is sent
+    UPLOAD_CONNECT_TIMEOUT = 10
+    UPLOAD_READ_TIMEOUT = 300
+
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    # Seconds a model must stay selected before it is speculatively downloaded
+    PREFETCH_DELAY = 0.5
+    # Models downloaded at once when replacing placeholders
+    PLACEHOLDER_DOWNLOAD_WORKERS = 4
+    # Enough of an image file to read its size from the header
+    IMAGE_HEADER_SIZE = 256 * 1024
+    # Seconds to wait for the glTF JSON sizing a placeholder
+    PLACEHOLDER_TIMEOUT = 30
 
 class Utils:
     def humanify_size(size):
@@ -524,7 +572,7 @@ class IcosaApi:
 
     def write_model_info(self, title, author, author_url, _license, asset_id):
         try:
-            downloadHistory = getattr(_get_addon_preferences(), 'downloadHistory', "")
+            downloadHistory = get_preference('downloadHistory', "")
             if downloadHistory != "":
                 downloadHistory = os.path.abspath(downloadHistory)
                 createFile = False
@@ -561,91 +609,77 @@ class IcosaApi:
     def download_model(self, asset_id):
         icosa_model = get_icosa_model(asset_id)
         if icosa_model is not None:  # The model comes from the search results
-            if icosa_model.zip_archive_url:  # TODO handle expiration: and (time.time() - icosa_model.time_url_requested < icosa_model.url_expires):
-                self.get_download(icosa_model.zip_archive_url, [], asset_id, icosa_model.title)
-            elif icosa_model.download_url:
-                self.get_download(icosa_model.download_url, icosa_model.resource_urls, asset_id, icosa_model.title)
+            # TODO handle expiration: and (time.time() - icosa_model.time_url_requested < icosa_model.url_expires):
+            main_url, additional_urls = icosa_model.get_urls()
+            if main_url:
+                self.get_download(main_url, additional_urls, asset_id, icosa_model.title)
         else:  # Model comes from a direct link
             icosa_props = get_icosa_props()
             # TODO
 
     def get_download(self, main_url, additional_urls, asset_id, title):
 
-        main_filename = urllib.parse.urlparse(main_url).path.split('/')[-1]
-        # If the main url is a zip file, we never need to download additional files
-        if main_filename.endswith('.zip'):
-            additional_urls = []
-
         if main_url is None:
             print('Url is None')
             return
 
-        temp_dir = os.path.join(Config.ICOSA_MODEL_DIR, asset_id)
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-
-        all_urls = [main_url] + additional_urls
-
-        main_resource_path = None
-
-        for url in all_urls:
-            resource_filename = urllib.parse.urlparse(url).path.split('/')[-1]
-
-            resource_path = os.path.join(temp_dir, resource_filename)
-            if not main_resource_path:
-                main_resource_path = resource_path
-
-            if not os.path.exists(resource_path):  # Not downloaded yet
-
-                # wm = bpy.context.window_manager
-                # wm.progress_begin(0, 100)
-                # set_log("Downloading model..")
-
-                with open(resource_path, "wb") as f:
-                    req = requests_get(url, stream=True)
-                    f.write(req.content)
-
-                # TODO: Handle progress
-                #     total_length = req.headers.get('content-length')
-                #     if total_length is None:  # no content length header
-                #         f.write(req.content)
-                #     else:
-                #         dl = 0
-                #         total_length = int(total_length)
-                #         for data in req.iter_content(chunk_size=4096):
-                #             dl += len(data)
-                #             f.write(data)
-                #             done = int(100 * dl / total_length)
-                #             wm.progress_update(done)
-                #             set_log("Downloading model..{}%".format(done))
-                # wm.progress_end()
-            else:
-                print('Model already downloaded')
+        # Repeated imports of an asset share its data
+        if get_preference('instanceRepeatedAssets', True):
+            if instance_existing_asset(bpy.context, asset_id, title) is not None:
+                return
 
-        model_path = None
-        if main_filename.endswith('.zip'):
-            extract_path = unzip_archive(resource_path)
-            # Get the first gltf file in the extracted directory
-            # TODO Handle scenario where there are zero or multiple gltf files
-            gltf_files = glob.glob(os.path.join(extract_path, '*.gltf'))
-            obj_files = glob.glob(os.path.join(extract_path, '*.obj'))
-            if gltf_files:
-                model_path = gltf_files[0]
-            elif obj_files:
-                model_path = obj_files[0]
-        else:
-            model_path = main_resource_path
+        model = get_icosa_model(asset_id)
+        if refuse_over_budget(bpy.context, model):
+            return
+
+        # Only a box sized from the model, replaced later
+        if get_icosa_props().import_as_placeholder:
+            import_placeholder(main_url, additional_urls, asset_id, title)
+            return
+
+        # The processed result of a previous import is reused as is
+        cache_path = ''
+        if get_preference('useBlendCache', True) or get_preference('importInBackground', False):
+            cache_path = get_asset_cache_path(asset_id, main_url)
+            if get_preference('useBlendCache', True) and os.path.exists(cache_path):
+                collection = append_cached_asset(bpy.context, cache_path, asset_id)
+                if collection is not None:
+                    apply_import_options(bpy.context, collection)
+                    set_import_status('')
+                    return
+                print("Invalid cached asset: {}".format(cache_path))
+
+        # Convert the model in a background Blender, and only append the result
+        if get_preference('importInBackground', False):
+            bpy.ops.wm.icosa_background_import('INVOKE_DEFAULT', asset_id=asset_id, title=title, main_url=main_url,
+                                               additional_urls=json.dumps(additional_urls), cache_path=cache_path)
+            return
+
+        # A speculative download of this model may still be running
+        if prefetch_pending(asset_id):
+            bpy.ops.wm.icosa_wait_prefetch('INVOKE_DEFAULT', asset_id=asset_id, title=title, main_url=main_url,
+                                           additional_urls=json.dumps(additional_urls))
+            return
+
+        main_resource_path = fetch_model_files(main_url, additional_urls, asset_id)
+        model_path = find_model_file(main_resource_path)
+
+        # The face count of the search results may differ from the downloaded file
+        if model_path and model is not None and model.inspection is None:
+            inspect_model_file(model, model_path, get_material_library_path())
+            if refuse_over_budget(bpy.context, model):
+                Utils.clean_downloaded_model_dir(asset_id)
+                return
 
         if model_path:
             try:
-                import_model(model_path, asset_id, title)
+                import_model(model_path, asset_id, title, cache_path)
             except Exception as e:
                 import traceback
                 print(traceback.format_exc())
         else:
             ShowMessage("ERROR", "Download error", "Failed to download model (url might be invalid)")
-            model = get_icosa_model(asset_id)
-            set_import_status("Import model ({})".format(model.download_size if model.download_size else 'fetching data'))
+            set_import_status("Import model ({})".format(model.download_size if model and model.download_size else 'fetching data'))
         return
 
 
@@ -872,6 +906,56 @@ class IcosaBrowserProps(bpy.types.PropertyGroup):
             maxlen=1024,
             options={'TEXTEDIT_UPDATE'})
 
+    expanded_import_options: BoolProperty(default=False)
+    triangle_budget: IntProperty(
+            name="Triangle budget",
+            description=(
+                "Models going over this number of triangles are decimated on import,\n"
+                "their full resolution meshes being kept in an excluded collection (0 to disable)"
+            ),
+            default=0,
+            min=0)
+    triangle_budget_scope: EnumProperty(
+            name="Budget",
+            items=(
+                ('ASSET', "Per model", "Each imported model gets the whole budget"),
+                ('SCENE', "Per scene", "The budget is shared with the triangles already in the scene"),
+            ),
+            default='ASSET')
+    over_budget_action: EnumProperty(
+            name="Over budget",
+            items=(
+                ('DECIMATE', "Decimate", "Decimate models going over the budget"),
+                ('REFUSE', "Skip", "Don't import models going over the budget"),
+            ),
+            default='DECIMATE')
+    import_as_placeholder: BoolProperty(
+            name="Import as placeholder",
+            description=(
+                "Only add a box sized from the model with its thumbnail, for scene layout.\n"
+                "Placeholders are replaced by their models all at once"
+            ),
+            default=False)
+    merge_by_material: BoolProperty(
+            name="Merge by material",
+            description=(
+                "Join the objects sharing a material under the same parent, such as\n"
+                "the strokes of Open Brush sketches, to reduce the number of draw calls"
+            ),
+            default=False)
+    proxy_textures: BoolProperty(
+            name="Proxy textures",
+            description=(
+                "Point the images of imported models to downscaled copies, to save\n"
+                "video memory in the viewport. Restore them before the final render"
+            ),
+            default=False)
+    proxy_texture_size: IntProperty(
+            name="Max size",
+            description="Largest dimension of the proxy textures, in pixels",
+            default=1024,
+            min=16)
+
 
 def list_current_results(self, context):
     icosa_props = get_icosa_props()
@@ -927,9 +1011,29 @@ def draw_model_info(layout, model, context):
     else:
         ui_model_props.label(text='Unknown face count..')
 
+    if model.inspection:
+        draw_model_inspection(ui_model_props, model.inspection)
+
     layout.separator()
 
 
+def draw_model_inspection(layout, inspection):
+    layout.label(text='Triangles: {}  Vertices: {}'.format(
+        Utils.humanify_number(inspection['triangles']), Utils.humanify_number(inspection['vertices'])), icon='MESH_DATA')
+
+    sizes = [size for name, size in inspection['textures'] if size]
+    if sizes:
+        largest = max(sizes, key=lambda size: size[0] * size[1])
+        layout.label(text='Textures: {} (up to {}x{})'.format(len(inspection['textures']), *largest), icon='TEXTURE')
+    elif inspection['textures']:
+        layout.label(text='Textures: {}'.format(len(inspection['textures'])), icon='TEXTURE')
+    layout.label(text='GPU memory: ~{}'.format(Utils.humanify_size(inspection['gpu_memory'])), icon='MEMORY')
+
+    # Resolved by inspect_model_file
+    if inspection.get('library_materials'):
+        layout.label(text='Library materials: {}'.format(', '.join(inspection['library_materials'])), icon='MATERIAL')
+
+
 def draw_import_button(layout, model, context):
 
     import_ops = layout.row()
@@ -952,6 +1056,47 @@ def draw_import_button(layout, model, context):
     import_ops.operator("wm.icosa_download", icon=download_icon, text=downloadlabel, translate=False, emboss=True).asset_id = model.asset_id
 
 
+def draw_import_options(layout, context):
+    props = get_icosa_props()
+
+    col = layout.box().column(align=True)
+    row = col.row()
+    row.prop(props, "expanded_import_options", icon="TRIA_DOWN" if props.expanded_import_options else "TRIA_RIGHT", icon_only=True, emboss=False)
+    row.label(text="Import options")
+    if not props.expanded_import_options:
+        return
+
+    col.separator()
+    row = col.row()
+    row.prop(props, "import_as_placeholder")
+    row.operator("wm.icosa_replace_placeholders", text="Replace all")
+
+    col.separator()
+    col.prop(props, "triangle_budget")
+    row = col.row()
+    row.enabled = props.triangle_budget > 0
+    row.prop(props, "triangle_budget_scope", expand=True)
+    row = col.row()
+    row.enabled = props.triangle_budget > 0
+    row.prop(props, "over_budget_action", expand=True)
+    row = col.row(align=True)
+    row.operator("wm.icosa_swap_lod", text="Decimated").full_resolution = False
+    row.operator("wm.icosa_swap_lod", text="Full resolution").full_resolution = True
+
+    col.separator()
+    row = col.row()
+    row.prop(props, "merge_by_material")
+    row.operator("wm.icosa_unmerge", text="Unmerge")
+
+    col.separator()
+    row = col.row()
+    row.prop(props, "proxy_textures")
+    sub = row.row()
+    sub.enabled = props.proxy_textures
+    sub.prop(props, "proxy_texture_size")
+    col.operator("wm.icosa_restore_textures", text="Restore full resolution textures")
+
+
 def set_log(log):
     get_icosa_props().status = f"log: {log}"
 
@@ -977,6 +1122,233 @@ def unzip_archive(archive_path):
         print('ERROR: archive doesn\'t exist')
 
 
+def download_file(url, path, cancel_event=None, size_limit=None, downloaded=0):
+    """
+    Stream a url to disk, through a .part file so that an interrupted download
+    is never mistaken for a complete one
+
+    Args:
+        url: Url of the resource
+        path: Destination path
+        cancel_event: Optional threading.Event, aborts the download when set
+        size_limit: Optional maximum number of bytes (including `downloaded`)
+        downloaded: Number of bytes already downloaded for the same model
+
+    Returns:
+        Total number of bytes downloaded for the model, or None if the download
+        failed, was cancelled or exceeded the size limit
+    """
+    part_path = '{}.{}.part'.format(path, threading.get_ident())
+    try:
+        with requests_get(url, stream=True) as req:
+            if req.status_code != 200:
+                print("Download failed ({}): {}".format(req.status_code, url))
+                return None
+
+            total_length = req.headers.get('content-length')
+            if size_limit and total_length is not None and downloaded + int(total_length) > size_limit:
+                return None
+
+            with open(part_path, "wb") as f:
+                for data in req.iter_content(chunk_size=Config.DOWNLOAD_CHUNK_SIZE):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    downloaded += len(data)
+                    if size_limit and downloaded > size_limit:
+                        break
+                    f.write(data)
+                else:
+                    os.replace(part_path, path)
+                    return downloaded
+    except requests.exceptions.RequestException as e:
+        print("Download failed: {}".format(e))
+
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    return None
+
+
+def fetch_model_files(main_url, additional_urls, asset_id, cancel_event=None, size_limit=None):
+    """
+    Download the main model file and its resources into the model directory,
+    skipping the files which are already there
+
+    Returns:
+        Path to the main resource, or None if a download did not complete
+    """
+    main_filename = urllib.parse.urlparse(main_url).path.split('/')[-1]
+    # If the main url is a zip file, we never need to download additional files
+    if main_filename.endswith('.zip'):
+        additional_urls = []
+
+    temp_dir = os.path.join(Config.ICOSA_MODEL_DIR, asset_id)
+    if not os.path.exists(temp_dir):
+        os.makedirs(temp_dir)
+
+    main_resource_path = None
+    downloaded = 0
+    for url in [main_url] + additional_urls:
+        resource_filename = urllib.parse.urlparse(url).path.split('/')[-1]
+
+        resource_path = os.path.join(temp_dir, resource_filename)
+        if not main_resource_path:
+            main_resource_path = resource_path
+
+        if os.path.exists(resource_path):
+            print('Model already downloaded')
+            downloaded += os.path.getsize(resource_path)
+            continue
+
+        downloaded = download_file(url, resource_path, cancel_event, size_limit, downloaded)
+        if downloaded is None:
+            return None
+
+    return main_resource_path
+
+
+def find_extracted_model(extract_path):
+    # Get the first gltf file in the extracted directory
+    # TODO Handle scenario where there are zero or multiple gltf files
+    gltf_files = glob.glob(os.path.join(extract_path, '*.gltf')) + glob.glob(os.path.join(extract_path, '*.glb'))
+    obj_files = glob.glob(os.path.join(extract_path, '*.obj'))
+    if gltf_files:
+        return gltf_files[0]
+    elif obj_files:
+        return obj_files[0]
+    return None
+
+
+def find_model_file(main_resource_path):
+    """Path of the model file to import from a downloaded main resource, extracting zip archives"""
+    if not main_resource_path or not main_resource_path.endswith('.zip'):
+        return main_resource_path
+
+    # The archive may have been extracted by the prefetcher already
+    model_path = find_extracted_model(os.path.dirname(main_resource_path))
+    if model_path:
+        return model_path
+
+    extract_path = unzip_archive(main_resource_path)
+    if not isinstance(extract_path, str):
+        return None
+    return find_extracted_model(extract_path)
+
+
+def inspect_model_file(model, model_path, library_path=None):
+    """
+    Inspect a downloaded .gltf/.glb model, keeping the result on the model.
+    Its materials are also resolved from the library, if its index is built
+    already, so that drawing the inspection doesn't read the index
+
+    Args:
+        library_path: Material library, see get_material_library_path, which
+            must be called from the main thread
+    """
+    if not model_path or not model_path.lower().endswith(('.gltf', '.glb')):
+        return None
+    try:
+        inspection = gltf_utils.inspect_model(model_path)
+        index = MaterialLibraryIndex.peek(library_path) if library_path and inspection['materials'] else None
+        if index is not None:
+            inspection['library_materials'] = sorted({index.resolve(name) for name in inspection['materials']} - {None})
+        model.inspection = inspection
+    except Exception as e:
+        print("Failed to inspect {}: {}".format(model_path, e))
+    return model.inspection
+
+
+class ModelPrefetcher(threading.Thread):
+    """
+    Speculatively downloads the model selected in the search results, so that
+    clicking Import can usually go straight to the import stage
+    """
+    def __init__(self, model, size_limit):
+        self.model = model
+        self.asset_id = model.asset_id
+        self.main_url, self.additional_urls = model.get_urls()
+        self.size_limit = size_limit
+        self.library_path = get_material_library_path()
+        self.cancelled = threading.Event()
+        threading.Thread.__init__(self, daemon=True)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        # Leave some time to the user to browse through the results
+        # before starting a download that would compete with thumbnails
+        if self.cancelled.wait(Config.PREFETCH_DELAY) or not self.main_url:
+            return
+        main_resource_path = fetch_model_files(self.main_url, self.additional_urls, self.asset_id, self.cancelled, self.size_limit)
+        if not main_resource_path:
+            return
+        print("Prefetched model {}".format(self.asset_id))
+
+        # Extract and inspect the model, to show what importing it would cost
+        if main_resource_path.endswith('.zip') and not self.cancelled.is_set():
+            import zipfile
+            try:
+                with zipfile.ZipFile(main_resource_path, 'r') as zip_ref:
+                    zip_ref.extractall(os.path.dirname(main_resource_path))
+            except zipfile.BadZipFile:
+                return
+        if not self.cancelled.is_set():
+            inspect_model_file(self.model, find_model_file(main_resource_path), self.library_path)
+
+
+prefetcher = None
+
+
+def prefetch_model(model):
+    """Start a speculative download of the selected model, cancelling the previous one"""
+    global prefetcher
+    if prefetcher is not None and prefetcher.asset_id == model.asset_id:
+        return
+
+    cancel_prefetch()
+
+    if not get_preference('speculativePrefetch', False):
+        return
+
+    size_limit = get_preference('prefetchSizeLimit', 50) * 1024 * 1024
+    prefetcher = ModelPrefetcher(model, size_limit)
+    prefetcher.start()
+
+
+def cancel_prefetch():
+    global prefetcher
+    if prefetcher is not None:
+        prefetcher.cancel()
+        prefetcher = None
+
+
+def prefetch_pending(asset_id):
+    """
+    Whether a prefetch of this model is still running, which should be left
+    to finish instead of downloading the model twice. A prefetch of any other
+    model is cancelled
+    """
+    global prefetcher
+    if prefetcher is None:
+        return False
+    if prefetcher.asset_id == asset_id and prefetcher.is_alive():
+        return True
+    if prefetcher.asset_id != asset_id:
+        prefetcher.cancel()
+    prefetcher = None
+    return False
+
+
+def prefetch_selected_result(self, context):
+    """Update of the selected search result"""
+    props = get_icosa_props()
+    if "current" not in props.search_results:
+        return
+    model = props.search_results['current'].get(context.window_manager.result_previews)
+    if model:
+        prefetch_model(model)
+
+
 def run_async(func):
     from threading import Thread
     from functools import wraps
@@ -990,41 +1362,149 @@ def run_async(func):
     return async_func
 
 
-def convert_material_name(material_name, suffix_pattern):
-    """
-    Convert material name using the following algorithm:
-    1. Strip common prefixes off incoming material names
-    2. Look up in GUID mapping dictionary
-    3. If no match, add "ob-" prefix to incoming material
-    4. All matching is case-insensitive
+GUID_PATTERN = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+COMMON_MATERIAL_PREFIXES = ('material_', 'mat_', 'brush_', 'tilt_')
+# Numeric suffix added by Blender to duplicated datablock names
+MATERIAL_SUFFIX_PATTERN = re.compile(r'\.\d{3}$')
 
-    Args:
-        material_name: Original material name from GLTF
-        suffix_pattern: Pattern to remove (e.g., '.001') - deprecated but kept for compatibility
 
-    Returns:
-        Converted material name for matching with library
+def strip_material_prefix(material_name):
+    """Strip common prefixes off incoming material names"""
+    for prefix in COMMON_MATERIAL_PREFIXES:
+        if material_name.lower().startswith(prefix):
+            return material_name[len(prefix):]
+    return material_name
+
+
+class MaterialLibraryIndex:
     """
-    import re
-    from . import name_mapping
-
-    # Step 1: Strip common prefixes
-    cleaned_name = material_name
-    common_prefixes = ['material_', 'mat_', 'brush_', 'tilt_']
-    for prefix in common_prefixes:
-        if cleaned_name.lower().startswith(prefix):
-            cleaned_name = cleaned_name[len(prefix):]
-            break
+    Names of the materials of a library .blend, and the brush GUIDs resolving
+    to them. Persisted on disk and rebuilt only when the library changes, so
+    that matching materials doesn't require scanning the library
+    """
+    INDEX_FILE = os.path.join(
+        bpy.utils.user_resource("SCRIPTS", path="icosa_cache", create=True),
+        "material_index.json"
+    )
+    INDEX_VERSION = 1
+
+    # Indexes already read in this session, by library path
+    loaded = {}
+
+    def __init__(self, data):
+        self.key = data['key']
+        self.materials = data['materials']
+        self.by_name = data['by_name']
+        self.by_guid = data['by_guid']
+
+    @staticmethod
+    def library_key(library_path):
+        stat = os.stat(library_path)
+        return [MaterialLibraryIndex.INDEX_VERSION, PLUGIN_VERSION, stat.st_mtime, stat.st_size]
+
+    @staticmethod
+    def get(library_path):
+        library_path = os.path.realpath(library_path)
+        key = MaterialLibraryIndex.library_key(library_path)
+
+        index = MaterialLibraryIndex.loaded.get(library_path)
+        if index is not None and index.key == key:
+            return index
+
+        stored = MaterialLibraryIndex.read()
+        data = stored.get(library_path)
+        if data is None or data.get('key') != key:
+            data = MaterialLibraryIndex.build(library_path, key)
+            stored[library_path] = data
+            MaterialLibraryIndex.write(stored)
+
+        index = MaterialLibraryIndex(data)
+        MaterialLibraryIndex.loaded[library_path] = index
+        return index
+
+    @staticmethod
+    def peek(library_path):
+        """Index of a library if it doesn't need to be built, None otherwise"""
+        library_path = os.path.realpath(library_path)
+        key = MaterialLibraryIndex.library_key(library_path)
+
+        index = MaterialLibraryIndex.loaded.get(library_path)
+        if index is None or index.key != key:
+            data = MaterialLibraryIndex.read().get(library_path)
+            if data is None or data.get('key') != key:
+                return None
+            index = MaterialLibraryIndex(data)
+            MaterialLibraryIndex.loaded[library_path] = index
+        return index
 
-    # Step 2: Check if this is a GUID and look it up in name_mapping
-    # GUIDs are in format: xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx
-    if re.match(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$', cleaned_name):
-        mapped_name = name_mapping.name_mapping.get(cleaned_name.lower())
-        if mapped_name:
-            return mapped_name
+    @staticmethod
+    def build(library_path, key):
+        from . import name_mapping
+
+        print(f"Indexing material library: {library_path}")
+        with bpy.data.libraries.load(library_path, link=False) as (data_from, data_to):
+            materials = list(data_from.materials)
+
+        # Check for duplicate base names in library
+        base_names = {}
+        for mat_name in materials:
+            base_names.setdefault(MATERIAL_SUFFIX_PATTERN.sub('', mat_name), []).append(mat_name)
+        for base, variants in base_names.items():
+            if len(variants) > 1:
+                print(f"Warning: Library contains multiple variants of '{base}': {variants}")
+
+        by_name = {mat.lower(): mat for mat in materials}
+        by_guid = {}
+        for guid, brush_name in name_mapping.name_mapping.items():
+            matched = by_name.get(brush_name.lower())
+            if matched:
+                by_guid[guid.lower()] = matched
+
+        return {
+            'key': key,
+            'materials': materials,
+            'by_name': by_name,
+            'by_guid': by_guid,
+        }
+
+    @staticmethod
+    def read():
+        if not os.path.exists(MaterialLibraryIndex.INDEX_FILE):
+            return {}
+        try:
+            with open(MaterialLibraryIndex.INDEX_FILE, 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except ValueError:
+            return {}
 
-    # Step 3: Return cleaned name as-is (caller will try with "ob-" prefix if needed)
-    return cleaned_name
+    @staticmethod
+    def write(stored):
+        # Replaced at once, batch workers reading and writing it concurrently
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(MaterialLibraryIndex.INDEX_FILE), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(stored).encode('utf-8'))
+            os.replace(temp_path, MaterialLibraryIndex.INDEX_FILE)
+        except:
+            os.remove(temp_path)
+            raise
+
+    def resolve(self, material_name):
+        """Name of the library material matching an imported material, or None"""
+        cleaned_name = strip_material_prefix(material_name)
+
+        if GUID_PATTERN.match(cleaned_name):
+            matched = self.by_guid.get(cleaned_name.lower())
+            if matched:
+                return matched
+
+        # Try case-insensitive match with converted name, then with "ob-"
+        # prefix added, then the original name as fallback
+        for candidate in (cleaned_name, "ob-" + cleaned_name, material_name):
+            matched = self.by_name.get(candidate.lower())
+            if matched:
+                return matched
+        return None
 
 
 def get_material_library_path():
@@ -1034,11 +1514,8 @@ def get_material_library_path():
     Returns:
         Path to material library .blend file, or None if not found
     """
-    # Get preferences
-    preferences = _get_addon_preferences()
-
     # Check if user has specified a custom library path
-    _mlp = getattr(preferences, 'materialLibraryPath', None)
+    _mlp = get_preference('materialLibraryPath', None)
     if _mlp and os.path.exists(_mlp):
         return _mlp
 
@@ -1052,231 +1529,1165 @@ def get_material_library_path():
     return None
 
 
-def swap_materials_from_library(imported_objects, asset_id):
+def load_library_materials(library_path, library_names, link_mode):
     """
-    Swap materials from imported GLTF with materials from library .blend file
+    Get materials from the library .blend, appending or linking only those
+    which are not already in the current file
 
     Args:
-        imported_objects: List of newly imported objects
-        asset_id: Asset ID of the imported model
-    """
-    try:
-        # Get material library path (checks for default bundled file)
-        library_path = get_material_library_path()
-
-        if not library_path:
-            print("Material library not configured or not found")
-            return
+        library_path: Path to the material library
+        library_names: Names of the library materials to get
+        link_mode: 'REUSE' to append each material once and reuse it afterwards,
+            'LINK' to link them from the library, 'APPEND' to always append new copies
 
-        # Get suffix pattern from preferences
-        preferences = _get_addon_preferences()
-        suffix_pattern = getattr(preferences, 'materialSuffixPattern', "")
-
-        print(f"Using material library: {library_path}")
-
-        # Collect all materials used by imported objects
-        imported_materials = set()
-        material_to_objects = {}  # Track which objects use which materials
+    Returns:
+        Dict of library material name -> material
+    """
+    library_path = os.path.realpath(library_path)
+    materials = {}
+
+    # Appended materials are tagged with their origin, linked ones keep a reference to their library
+    if link_mode == 'REUSE':
+        for mat in bpy.data.materials:
+            name = mat.get("icosa_library_material")
+            if name in library_names and mat.get("icosa_library") == library_path:
+                materials.setdefault(name, mat)
+    elif link_mode == 'LINK':
+        for mat in bpy.data.materials:
+            if mat.library and mat.name in library_names:
+                mat_library = os.path.realpath(bpy.path.abspath(mat.library.filepath))
+                if mat_library == library_path:
+                    materials[mat.name] = mat
+
+    missing = sorted(name for name in library_names if name not in materials)
+    if not missing:
+        return materials
+
+    with bpy.data.libraries.load(library_path, link=(link_mode == 'LINK')) as (data_from, data_to):
+        data_to.materials = missing
+
+    # After loading, data_to holds the loaded materials in the requested order
+    for name, mat in zip(missing, data_to.materials):
+        if mat is None:
+            continue
+        if not mat.library:
+            mat["icosa_library"] = library_path
+            mat["icosa_library_material"] = name
+        materials[name] = mat
+
+    return materials
+
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def run_stages(stages):
+    """Run a staged pipeline to completion, returning its result"""
+    while True:
+        try:
+            next(stages)
+        except StopIteration as done:
+            return done.value
 
-        for obj in imported_objects:
-            if obj.type == 'MESH':
-                for mat_slot in obj.material_slots:
-                    if mat_slot.material:
-                        mat_name = mat_slot.material.name
-                        imported_materials.add(mat_name)
-                        if mat_name not in material_to_objects:
-                            material_to_objects[mat_name] = []
-                        material_to_objects[mat_name].append((obj, mat_slot))
 
-        if not imported_materials:
-            print("No materials found on imported objects")
-            return
+def swap_materials_stages(imported_objects):
+    """
+    Swap materials from imported GLTF with materials from library .blend file,
+    yielding (stage, progress) between chunks of work
 
-        # Get list of existing materials before append (to track what gets added)
-        existing_materials = set(bpy.data.materials[:])
+    Args:
+        imported_objects: List of newly imported objects
+    """
+    # Get material library path (checks for default bundled file)
+    library_path = get_material_library_path()
 
-        # Load materials from library blend file
-        materials_to_append = {}  # Maps: imported_mat_name -> library_mat_name_to_append
-        with bpy.data.libraries.load(library_path, link=False) as (data_from, data_to):
-            # Get all available material names
-            available_materials = data_from.materials
-
-            # Check for duplicate base names in library
-            base_names = {}
-            for mat_name in available_materials:
-                # Strip numeric suffixes to find base name
-                import re
-                base = re.sub(r'\.\d{3}$', '', mat_name)
-                if base not in base_names:
-                    base_names[base] = []
-                base_names[base].append(mat_name)
-
-            # Warn about duplicates
-            for base, variants in base_names.items():
-                if len(variants) > 1:
-                    print(f"Warning: Library contains multiple variants of '{base}': {variants}")
-
-            # Create case-insensitive lookup for available materials
-            available_materials_lower = {mat.lower(): mat for mat in available_materials}
-
-            # Match imported materials with library materials
-            for imported_mat_name in imported_materials:
-                converted_name = convert_material_name(imported_mat_name, suffix_pattern)
-                matched_material = None
-
-                # Try case-insensitive match with converted name
-                if converted_name.lower() in available_materials_lower:
-                    matched_material = available_materials_lower[converted_name.lower()]
-                # Try with "ob-" prefix added (case-insensitive)
-                elif ("ob-" + converted_name).lower() in available_materials_lower:
-                    matched_material = available_materials_lower[("ob-" + converted_name).lower()]
-                # Try original name as fallback (case-insensitive)
-                elif imported_mat_name.lower() in available_materials_lower:
-                    matched_material = available_materials_lower[imported_mat_name.lower()]
-
-                if matched_material:
-                    materials_to_append[imported_mat_name] = matched_material
-                else:
-                    print(f"No match found in library for material: {imported_mat_name}")
-
-            # Append only the materials we need (don't rely on names after this)
-            data_to.materials = [materials_to_append[name] for name in materials_to_append]
-
-        # Identify the newly appended materials by comparing before/after
-        newly_appended = [mat for mat in bpy.data.materials if mat not in existing_materials]
-
-        # Create mapping: library_name_we_requested -> actual_material_object_we_got
-        library_name_to_material = {}
-        for mat in newly_appended:
-            # Try to match back to what we requested
-            # The appended material's name might have .001 etc added by Blender
-            mat_base = mat.name
-            # Strip any numeric suffix that Blender might have added
-            import re
-            mat_base_stripped = re.sub(r'\.\d{3}$', '', mat_base)
-
-            # Match back to our requested library names
-            for imported_name, library_name in materials_to_append.items():
-                library_base = re.sub(r'\.\d{3}$', '', library_name)
-                if mat_base == library_name or mat_base_stripped == library_base:
-                    library_name_to_material[imported_name] = mat
-                    break
+    if not library_path:
+        print("Material library not configured or not found")
+        return
 
-        # Now swap the materials using the actual material objects
-        swapped_count = 0
-        for imported_mat_name in materials_to_append.keys():
-            # Get the actual library material object
-            library_mat = library_name_to_material.get(imported_mat_name)
-            if not library_mat:
-                print(f"Warning: Could not find appended material for: {imported_mat_name}")
-                continue
+    print(f"Using material library: {library_path}")
+
+    # Collect all materials used by imported objects
+    imported_materials = set()
+    material_to_objects = {}  # Track which objects use which materials
+
+    mesh_objects = [obj for obj in imported_objects if obj.type == 'MESH']
+    for i, chunk in enumerate(chunks(mesh_objects, Config.IMPORT_CHUNK_SIZE)):
+        for obj in chunk:
+            for mat_slot in obj.material_slots:
+                if mat_slot.material:
+                    mat_name = mat_slot.material.name
+                    imported_materials.add(mat_name)
+                    if mat_name not in material_to_objects:
+                        material_to_objects[mat_name] = []
+                    material_to_objects[mat_name].append((obj, mat_slot))
+        yield 'Collecting materials', (i + 1) * Config.IMPORT_CHUNK_SIZE / len(mesh_objects)
+
+    if not imported_materials:
+        print("No materials found on imported objects")
+        return
 
-            # Get the imported material we're replacing
-            imported_mat = bpy.data.materials.get(imported_mat_name)
+    # Match imported materials with library materials
+    yield 'Matching materials', 0.0
+    index = MaterialLibraryIndex.get(library_path)
+    materials_to_append = {}  # Maps: imported_mat_name -> library_mat_name_to_append
+    for imported_mat_name in imported_materials:
+        matched_material = index.resolve(imported_mat_name)
+        if matched_material:
+            materials_to_append[imported_mat_name] = matched_material
+        else:
+            print(f"No match found in library for material: {imported_mat_name}")
 
-            # Replace material on all objects that use it
-            if imported_mat_name in material_to_objects:
-                for obj, mat_slot in material_to_objects[imported_mat_name]:
-                    mat_slot.material = library_mat
-                    swapped_count += 1
+    if not materials_to_append:
+        print("No materials were swapped (no matches found in library)")
+        return
 
-                # Remove the old imported material if it's no longer in use
-                if imported_mat and imported_mat.users == 0:
-                    bpy.data.materials.remove(imported_mat)
+    yield 'Appending materials', 0.0
+    link_mode = get_preference('materialLinkMode', 'REUSE')
+    library_materials = load_library_materials(library_path, set(materials_to_append.values()), link_mode)
+
+    # Now swap the materials using the actual material objects
+    slots = []
+    for imported_mat_name, library_name in materials_to_append.items():
+        # Get the actual library material object
+        library_mat = library_materials.get(library_name)
+        if not library_mat:
+            print(f"Warning: Could not find appended material for: {imported_mat_name}")
+            continue
+        print(f"Swapping material: {imported_mat_name} -> {library_mat.name}")
+        slots.extend((mat_slot, library_mat) for obj, mat_slot in material_to_objects.get(imported_mat_name, []))
+
+    for i, chunk in enumerate(chunks(slots, Config.IMPORT_CHUNK_SIZE)):
+        for mat_slot, library_mat in chunk:
+            mat_slot.material = library_mat
+        yield 'Assigning materials', (i + 1) * Config.IMPORT_CHUNK_SIZE / len(slots)
+
+    # Remove the old imported materials if they're no longer in use
+    for imported_mat_name in materials_to_append:
+        imported_mat = bpy.data.materials.get(imported_mat_name)
+        if imported_mat and imported_mat.users == 0:
+            bpy.data.materials.remove(imported_mat)
+
+    if slots:
+        print(f"Material swap complete: {len(slots)} material slots updated")
+    else:
+        print("No materials were swapped (no matches found in library)")
 
-                print(f"Swapped material: {imported_mat_name} -> {library_mat.name}")
 
-        if swapped_count > 0:
-            set_import_status(f'Swapped {swapped_count} materials from library')
-            print(f"Material swap complete: {swapped_count} material slots updated")
-        else:
-            print("No materials were swapped (no matches found in library)")
+def swap_materials_from_library(imported_objects, asset_id):
+    """
+    Swap materials from imported GLTF with materials from library .blend file
 
+    Args:
+        imported_objects: List of newly imported objects
+        asset_id: Asset ID of the imported model
+    """
+    try:
+        run_stages(swap_materials_stages(imported_objects))
     except Exception as e:
         print(f"Error swapping materials: {e}")
         import traceback
         traceback.print_exc()
 
 
-def import_model(model_path, asset_id, title):
-    bpy.ops.wm.import_modal('INVOKE_DEFAULT', model_path=model_path, asset_id=asset_id, title=title)
+def find_layer_collection(layer_collection, collection):
+    if layer_collection.collection == collection:
+        return layer_collection
+    for child in layer_collection.children:
+        found = find_layer_collection(child, collection)
+        if found is not None:
+            return found
+    return None
 
 
-def build_search_request(query, curated, include_tiltbrush, face_count, category, sort_by):
+def set_active_collection(context, collection):
+    """Make the collection active, returning the previously active layer collection"""
+    previous = context.view_layer.active_layer_collection
+    layer_collection = find_layer_collection(context.view_layer.layer_collection, collection)
+    if layer_collection is not None:
+        context.view_layer.active_layer_collection = layer_collection
+    return previous
 
-    final_query = '&name={}'.format(query) if query else ''
 
-    if curated:
-        final_query = final_query + '&curated=true'
+def create_import_collection(context, title, asset_id, parent=None):
+    """
+    Create a collection tagged with the asset id inside the parent collection,
+    or the active one. It is only made active while the importers run, see
+    set_active_collection
 
-    if not include_tiltbrush:
-        final_query = final_query + '&format=-TILT'
+    Returns:
+        The new collection
+    """
+    collection = bpy.data.collections.new(title)
+    collection["icosa_asset_id"] = asset_id
+    if parent is None:
+        parent = context.view_layer.active_layer_collection.collection
+    parent.children.link(collection)
+    return collection
 
-    if sort_by == 'NEWEST':
-        final_query = final_query + '&orderBy=NEWEST'
-    elif sort_by == 'OLDEST':
-        final_query = final_query + '&orderBy=OLDEST'
-    elif sort_by == 'BEST':
-        final_query = final_query + '&orderBy=BEST'
-    elif sort_by == 'TRIANGLE_COUNT':
-        final_query = final_query + '&orderBy=TRIANGLE_COUNT'
-    elif sort_by == 'LIKED_TIME':
-        final_query = final_query + '&orderBy=LIKED_TIME'
-    elif sort_by == 'CREATE_TIME':
-        final_query = final_query + '&orderBy=CREATE_TIME'
-    elif sort_by == 'UPDATE_TIME':
-        final_query = final_query + '&orderBy=UPDATE_TIME'
-    elif sort_by == 'LIKES':
-        final_query = final_query + '&orderBy=LIKES'
-    elif sort_by == 'DOWNLOADS':
-        final_query = final_query + '&orderBy=DOWNLOADS'
-    elif sort_by == 'DISPLAY_NAME':
-        final_query = final_query + '&orderBy=DISPLAY_NAME'
-    elif sort_by == 'AUTHOR_NAME':
-        final_query = final_query + '&orderBy=AUTHOR_NAME'
 
-    if face_count == '10K':
-        final_query = final_query + '&triangleCountMax=10000'
-    elif face_count == '50K':
-        final_query = final_query + '&triangleCountMin=10000&triangleCountMax=50000'
-    elif face_count == '100K':
-        final_query = final_query + '&triangleCountMin=50000&triangleCountMax=100000'
-    elif face_count == '250K':
-        final_query = final_query + "&triangleCountMin=100000&triangleCountMax=250000"
-    elif face_count == '250KP':
-        final_query = final_query + "&triangleCountMin=250000"
+def set_import_render_engine(scene):
+    if scene.render.engine not in ["CYCLES", "BLENDER_EEVEE_NEXT"]:
+        scene.render.engine = "BLENDER_EEVEE_NEXT"
 
-    if category != 'ALL':
-        final_query = final_query + '&category={}'.format(category)
 
-    return final_query
+def get_asset_cache_path(asset_id, source_url):
+    """
+    Path of the processed .blend cached for an asset, keyed by the downloaded
+    format, the add-on version and the material library in use
+    """
+    library_path = get_material_library_path()
+    library_key = MaterialLibraryIndex.library_key(library_path) if library_path else None
+    link_mode = get_preference('materialLinkMode', 'REUSE')
+    fingerprint = json.dumps([source_url, PLUGIN_VERSION, library_path, library_key, link_mode])
+    fingerprint = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(Config.ICOSA_BLEND_CACHE_DIR, '{}-{}.blend'.format(asset_id, fingerprint))
 
 
-def parse_results(r, *args, **kwargs):
+def save_asset_to_cache(collection, cache_path):
+    """Write the processed import collection and everything it uses to the cache"""
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
 
-    ongoingSearches.discard(r.url)
+    # Previous versions of the asset are obsolete
+    asset_id = collection["icosa_asset_id"]
+    for old_path in glob.glob(os.path.join(cache_dir, '{}-*.blend'.format(asset_id))):
+        os.remove(old_path)
 
-    icosa_props = get_icosa_props()
-    json_data = r.json()
+    bpy.data.libraries.write(cache_path, {collection}, path_remap='ABSOLUTE')
+    print("Cached processed asset: {}".format(cache_path))
 
-    if 'current' in icosa_props.search_results:
-        icosa_props.search_results['current'].clear()
-        del icosa_props.search_results['current']
 
-    icosa_props.search_results['current'] = OrderedDict()
+def merge_library_materials(objects):
+    """
+    Replace library materials brought in with appended data by the copies
+    already in the file, when library materials are reused
+    """
+    if get_preference('materialLinkMode', 'REUSE') != 'REUSE':
+        return
 
-    for result in list(json_data.get('assets', [])):
+    new_materials = set()
+    for obj in objects:
+        for mat_slot in obj.material_slots:
+            if mat_slot.material and mat_slot.material.get("icosa_library"):
+                new_materials.add(mat_slot.material)
+    if not new_materials:
+        return
 
-        # Dirty fix to avoid parsing obsolete data
-        if 'current' not in icosa_props.search_results:
-            return
+    existing = {}
+    for mat in bpy.data.materials:
+        if mat not in new_materials and mat.get("icosa_library"):
+            existing.setdefault((mat["icosa_library"], mat.get("icosa_library_material")), mat)
 
-        asset_id = result['assetId']
-        icosa_props.search_results['current'][result['assetId']] = IcosaModel(result)
+    for mat in new_materials:
+        reused = existing.get((mat["icosa_library"], mat.get("icosa_library_material")))
+        if reused is not None:
+            mat.user_remap(reused)
+            bpy.data.materials.remove(mat)
 
-        if not os.path.exists(os.path.join(Config.ICOSA_THUMB_DIR, asset_id) + '.png'):
-            icosa_props.icosa_api.request_thumbnail(result['thumbnail'], asset_id)
-        elif asset_id not in icosa_props.custom_icons:
+
+def append_cached_asset(context, cache_path, asset_id):
+    """
+    Append a processed asset from the cache into the active collection
+
+    Returns:
+        The appended collection, or None if the cache doesn't contain the asset
+    """
+    with bpy.data.libraries.load(cache_path, link=False) as (data_from, data_to):
+        data_to.collections = list(data_from.collections)
+
+    # Only the import collection is tagged, the others are its children
+    collection = None
+    for loaded in data_to.collections:
+        if loaded is not None and loaded.get("icosa_asset_id") == asset_id:
+            collection = loaded
+    if collection is None:
+        return None
+
+    set_import_render_engine(context.scene)
+    context.view_layer.active_layer_collection.collection.children.link(collection)
+    merge_library_materials(collection.all_objects)
+
+    for obj in collection.all_objects:
+        if obj.parent is None:
+            obj.select_set(True)
+    return collection
+
+
+def count_triangles(objects):
+    """Triangle count of each mesh object, computed from the polygon sizes in bulk"""
+    counts = {}
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        polygons = obj.data.polygons
+        loop_totals = np.empty(len(polygons), dtype=np.int32)
+        polygons.foreach_get('loop_total', loop_totals)
+        counts[obj] = int(loop_totals.sum()) - 2 * len(polygons)
+    return counts
+
+
+def decimate_to_budget(context, collection, budget):
+    """
+    Replace the meshes of an imported collection with decimated copies when
+    it goes over the triangle budget. The full resolution meshes are kept on
+    objects of an excluded collection, and referenced by the decimated objects
+    so that both can be swapped later
+    """
+    counts = {obj: count for obj, count in count_triangles(collection.all_objects).items() if count}
+    total = sum(counts.values())
+    if budget <= 0 or total <= budget:
+        return
+
+    ratio = max(budget / total, Config.MIN_DECIMATE_RATIO)
+    set_import_status('Decimating to {} triangles'.format(Utils.humanify_number(budget)))
+    print("Decimating {} from {} triangles (ratio {:.3f})".format(collection.name, total, ratio))
+
+    # Not a child of the import collection, which would make it part of its instances
+    full_collection = bpy.data.collections.new('{} (full resolution)'.format(collection.name))
+    context.scene.collection.children.link(full_collection)
+    find_layer_collection(context.view_layer.layer_collection, full_collection).exclude = True
+
+    # Evaluate all the decimate modifiers at once
+    modifiers = {}
+    for obj in counts:
+        modifier = obj.modifiers.new("Icosa LOD", 'DECIMATE')
+        modifier.ratio = ratio
+        modifiers[obj] = modifier
+    depsgraph = context.evaluated_depsgraph_get()
+
+    for obj, modifier in modifiers.items():
+        lod_mesh = bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+        obj.modifiers.remove(modifier)
+
+        full_mesh = obj.data
+        lod_mesh.name = '{} LOD'.format(full_mesh.name)
+        full_object = bpy.data.objects.new('{} (full resolution)'.format(obj.name), full_mesh)
+        full_object.matrix_world = obj.matrix_world
+        full_collection.objects.link(full_object)
+
+        obj.data = lod_mesh
+        obj["icosa_full_mesh"] = full_mesh
+        obj["icosa_lod_mesh"] = lod_mesh
+
+
+def available_triangle_budget(context, collection=None):
+    """Triangles an import may use, not counting the objects of its collection, 0 if unlimited"""
+    props = get_icosa_props()
+    budget = props.triangle_budget
+    if budget <= 0:
+        return 0
+
+    if props.triangle_budget_scope == 'SCENE':
+        # Objects of excluded collections, such as the full resolution copies
+        # kept by decimation and the unmerged originals, aren't in the view layer
+        imported = set(collection.all_objects) if collection else set()
+        others = [obj for obj in context.view_layer.objects if obj not in imported]
+        budget -= sum(count_triangles(others).values())
+        budget = max(budget, 1)
+    return budget
+
+
+def apply_import_budget(context, collection):
+    budget = available_triangle_budget(context, collection)
+    if budget > 0:
+        decimate_to_budget(context, collection, budget)
+
+
+def refuse_over_budget(context, model):
+    """
+    Whether a model goes over the triangle budget and should be skipped,
+    judging from its inspection if it was downloaded, or its face count
+    """
+    if model is None or get_icosa_props().over_budget_action != 'REFUSE':
+        return False
+    triangles = model.inspection['triangles'] if model.inspection else model.face_count
+    budget = available_triangle_budget(context)
+    if not triangles or budget <= 0 or triangles <= budget:
+        return False
+
+    ShowMessage("ERROR", "Over budget", "{} has {} triangles, over the budget of {}".format(
+        model.title, Utils.humanify_number(triangles), Utils.humanify_number(budget)))
+    set_import_status('')
+    return True
+
+
+def collection_images(collection):
+    """Images used by the materials of the objects of a collection, node groups included"""
+    images = set()
+    node_trees = [slot.material.node_tree for obj in collection.all_objects
+                  for slot in obj.material_slots if slot.material and slot.material.node_tree]
+    visited = set()
+    while node_trees:
+        node_tree = node_trees.pop()
+        if node_tree in visited:
+            continue
+        visited.add(node_tree)
+        for node in node_tree.nodes:
+            if node.type == 'TEX_IMAGE' and node.image:
+                images.add(node.image)
+            elif node.type == 'GROUP' and node.node_tree:
+                node_trees.append(node.node_tree)
+    return images
+
+
+def image_content_hash(image):
+    """
+    Hash of the packed data or file of an image. The hash of a file is kept
+    on the image along with its path, time and size, so that it is only
+    computed again when the file changes. Packed data is always hashed, its
+    size alone not telling images apart
+
+    Returns:
+        The hash, or None for images without data of their own
+    """
+    if image.library or image.source != 'FILE':
+        return None
+    # Proxies keep the hash of their full resolution image
+    if "icosa_full_res_path" in image:
+        return image.get("icosa_content_hash")
+    if image.get("icosa_full_res_image") is not None:
+        return image_content_hash(image["icosa_full_res_image"])
+
+    if image.packed_file:
+        content_hash = hashlib.sha1(image.packed_file.data).hexdigest()
+        image["icosa_content_key"] = 'packed:{}'.format(content_hash)
+        image["icosa_content_hash"] = content_hash
+        return content_hash
+
+    path = bpy.path.abspath(image.filepath)
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    key = '{}:{}:{}'.format(os.path.realpath(path), stat.st_mtime, stat.st_size)
+    if image.get("icosa_content_key") == key:
+        return image.get("icosa_content_hash")
+
+    content_hash = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(Config.DOWNLOAD_CHUNK_SIZE), b''):
+            content_hash.update(data)
+    content_hash = content_hash.hexdigest()
+    image["icosa_content_key"] = key
+    image["icosa_content_hash"] = content_hash
+    return content_hash
+
+
+def deduplicate_images(images):
+    """
+    Remap images holding the same pixels as an image already in the file,
+    or as another of the given images, to a single image
+
+    Returns:
+        Number of removed images
+    """
+    def dedup_key(image):
+        content_hash = image_content_hash(image)
+        if content_hash is None:
+            return None
+        return content_hash, image.colorspace_settings.name, image.alpha_mode
+
+    images = set(images)
+    canonical = {}
+    # Images of earlier imports already have their hash, others aren't hashed
+    for image in bpy.data.images:
+        if image not in images and "icosa_content_hash" in image:
+            key = dedup_key(image)
+            if key is not None:
+                canonical.setdefault(key, image)
+
+    duplicates = []
+    for image in sorted(images, key=lambda image: image.name):
+        key = dedup_key(image)
+        if key is None:
+            continue
+        if key in canonical:
+            image.user_remap(canonical[key])
+            duplicates.append(image)
+        else:
+            canonical[key] = image
+
+    bpy.data.batch_remove([image for image in duplicates if image.users == 0])
+    return len(duplicates)
+
+
+def image_fits(data, max_size):
+    """Whether PNG or JPEG data is known from its header to fit in max_size"""
+    size = gltf_utils.read_image_size(data[:Config.IMAGE_HEADER_SIZE])
+    return size is not None and max(size) <= max_size
+
+
+def create_proxy_textures(images, max_size):
+    """
+    Point images to copies downscaled to fit in max_size, written to the
+    proxy directory with image_utils.resize_image_files. The full resolution
+    file is kept in the "icosa_full_res_path" property. Images which already
+    fit, judging from their file header, are left alone. Packed images stay
+    packed in the file: their users are remapped to a new image of the proxy,
+    which keeps the packed image in its "icosa_full_res_image" property
+
+    Returns:
+        Number of images now using a proxy
+    """
+    sources = {}
+    for image in images:
+        if image.library or image.source != 'FILE' or "icosa_full_res_path" in image:
+            continue
+        if image.get("icosa_full_res_image") is not None:
+            continue
+        ext = os.path.splitext(image.filepath)[1]
+        if image.packed_file:
+            data = image.packed_file.data
+            if image_fits(data, max_size):
+                continue
+            ext = ext or ('.jpg' if data[:2] == b'\xff\xd8' else '.png')
+            key = hashlib.sha1(data).hexdigest()
+            src_path = os.path.join(Config.ICOSA_PROXY_DIR, key + ext)
+            if not os.path.exists(src_path):
+                with open(src_path, 'wb') as f:
+                    f.write(data)
+        else:
+            src_path = bpy.path.abspath(image.filepath, library=image.library)
+            if not os.path.exists(src_path):
+                continue
+            with open(src_path, 'rb') as f:
+                if image_fits(f.read(Config.IMAGE_HEADER_SIZE), max_size):
+                    continue
+            stat = os.stat(src_path)
+            key = hashlib.sha1(json.dumps([src_path, stat.st_mtime, stat.st_size]).encode()).hexdigest()
+        dst_path = os.path.join(Config.ICOSA_PROXY_DIR, '{}-{}{}'.format(key, max_size, ext))
+        sources[image] = (src_path, dst_path)
+
+    # Proxies of images shared between imports are only written once
+    jobs = {dst_path: src_path for src_path, dst_path in sources.values() if not os.path.exists(dst_path)}
+    results = image_utils.resize_image_files([(src, dst) for dst, src in jobs.items()], max_size) if jobs else {}
+
+    count = 0
+    for image, (src_path, dst_path) in sources.items():
+        result = results.get(dst_path)
+        if isinstance(result, Exception):
+            print("Failed to create a proxy of {}: {}".format(image.name, result))
+            continue
+        if not os.path.exists(dst_path):
+            # Already small enough
+            continue
+        if image.packed_file:
+            proxy = bpy.data.images.load(dst_path, check_existing=False)
+            proxy.name = image.name + '.proxy'
+            proxy.colorspace_settings.name = image.colorspace_settings.name
+            proxy.alpha_mode = image.alpha_mode
+            image.user_remap(proxy)
+            # Saved with the file even though nothing else uses it anymore
+            proxy["icosa_full_res_fake_user"] = image.use_fake_user
+            image.use_fake_user = True
+            proxy["icosa_full_res_image"] = image
+        else:
+            image["icosa_full_res_path"] = src_path
+            image.filepath = dst_path
+        count += 1
+    return count
+
+
+def restore_proxy_textures(images):
+    """
+    Point images using a proxy back to their full resolution file
+
+    Returns:
+        (number of restored images, names of the images whose file is missing)
+    """
+    restored = 0
+    missing = []
+    proxies = []
+    for image in list(images):
+        original = image.get("icosa_full_res_image")
+        if original is not None:
+            del image["icosa_full_res_image"]
+            image.user_remap(original)
+            original.use_fake_user = image.get("icosa_full_res_fake_user", False)
+            proxies.append(image)
+            restored += 1
+            continue
+
+        src_path = image.get("icosa_full_res_path")
+        if src_path is None:
+            continue
+        if not os.path.exists(src_path):
+            missing.append(image.name)
+            continue
+        image.filepath = src_path
+        del image["icosa_full_res_path"]
+        restored += 1
+
+    bpy.data.batch_remove(proxies)
+    return restored, missing
+
+
+def merge_by_material_stages(context, collection):
+    """
+    Join the mesh objects sharing a single material under the same parent,
+    with one join per material. The joined objects are copies, the original
+    objects being moved to an excluded collection and pointing to the object
+    they were merged into, so that the merge can be undone
+
+    Yields (stage, progress) between joins
+    """
+    groups = defaultdict(list)
+    for obj in collection.objects:
+        if obj.type != 'MESH' or len(obj.material_slots) != 1 or not obj.material_slots[0].material:
+            continue
+        if obj.children or obj.modifiers or obj.data.shape_keys or "icosa_full_mesh" in obj:
+            continue
+        groups[(obj.parent, obj.material_slots[0].material)].append(obj)
+    groups = [objects for objects in groups.values() if len(objects) > 1]
+    if not groups:
+        return
+
+    # Not a child of the import collection, which would make it part of its instances
+    unmerged_collection = bpy.data.collections.new('{} (unmerged)'.format(collection.name))
+    context.scene.collection.children.link(unmerged_collection)
+    find_layer_collection(context.view_layer.layer_collection, unmerged_collection).exclude = True
+
+    merged = 0
+    for i, objects in enumerate(groups):
+        target = objects[0].copy()
+        target.data = objects[0].data.copy()
+        target.name = objects[0].material_slots[0].material.name
+        copies = [target] + [obj.copy() for obj in objects[1:]]
+        for copy in copies:
+            collection.objects.link(copy)
+
+        with context.temp_override(active_object=target, object=target, selected_objects=copies, selected_editable_objects=copies):
+            bpy.ops.object.join()
+
+        for obj in objects:
+            collection.objects.unlink(obj)
+            unmerged_collection.objects.link(obj)
+            obj["icosa_merged_into"] = target
+        target["icosa_unmerged_collection"] = unmerged_collection
+        merged += len(objects)
+        yield 'Merging objects', (i + 1) / len(groups)
+
+    print("Merged {} objects of {} into {}".format(merged, collection.name, len(groups)))
+
+
+def unmerge_objects(merged_objects):
+    """
+    Bring back the original objects of merged objects, and remove the latter
+
+    Returns:
+        Number of restored objects
+    """
+    restored = 0
+    removed = []
+    # Originals of each merged object, listed once per unmerged collection
+    originals_by_target = {}
+    for merged in merged_objects:
+        unmerged_collection = merged.get("icosa_unmerged_collection")
+        if unmerged_collection is None:
+            continue
+        if unmerged_collection.name not in originals_by_target:
+            originals_by_target[unmerged_collection.name] = by_target = defaultdict(list)
+            for obj in unmerged_collection.objects:
+                target = obj.get("icosa_merged_into")
+                if target is not None:
+                    by_target[target.name].append(obj)
+        originals = originals_by_target[unmerged_collection.name].get(merged.name, [])
+        for obj in originals:
+            for user_collection in merged.users_collection:
+                user_collection.objects.link(obj)
+            unmerged_collection.objects.unlink(obj)
+            del obj["icosa_merged_into"]
+        restored += len(originals)
+        removed.append(merged)
+        if not unmerged_collection.objects:
+            removed.append(unmerged_collection)
+
+    meshes = [obj.data for obj in removed if isinstance(obj, bpy.types.Object)]
+    bpy.data.batch_remove(removed)
+    bpy.data.batch_remove([mesh for mesh in meshes if mesh.users == 0])
+    return restored
+
+
+def import_options_stages(context, collection):
+    """Apply the import options of the browser to an imported collection, see import_model_stages"""
+    props = get_icosa_props()
+    if props.merge_by_material:
+        yield from merge_by_material_stages(context, collection)
+    apply_import_budget(context, collection)
+    if get_preference('deduplicateTextures', True):
+        yield 'Deduplicating textures', 0.0
+        count = deduplicate_images(collection_images(collection))
+        if count:
+            print("Removed {} duplicate textures from {}".format(count, collection.name))
+    if props.proxy_textures:
+        yield 'Creating proxy textures', 0.0
+        count = create_proxy_textures(collection_images(collection), props.proxy_texture_size)
+        print("Created {} proxy textures for {}".format(count, collection.name))
+
+
+def apply_import_options(context, collection):
+    run_stages(import_options_stages(context, collection))
+
+
+def find_asset_collection(asset_id):
+    """Collection of an asset previously imported in the file, or None"""
+    for collection in bpy.data.collections:
+        if collection.get("icosa_asset_id") == asset_id and not collection.library:
+            return collection
+    return None
+
+
+def instance_existing_asset(context, asset_id, title):
+    """
+    Add an instance of the collection of an asset already imported in the file
+
+    Returns:
+        The instancing empty, or None if the asset isn't in the file yet
+    """
+    collection = find_asset_collection(asset_id)
+    if collection is None:
+        return None
+
+    instance = add_collection_instance(context, collection, title, asset_id)
+
+    for obj in context.selected_objects:
+        obj.select_set(False)
+    instance.select_set(True)
+    context.view_layer.objects.active = instance
+    return instance
+
+
+def add_collection_instance(context, collection, title, asset_id, matrix=None):
+    instance = bpy.data.objects.new(title, None)
+    instance.instance_type = 'COLLECTION'
+    instance.instance_collection = collection
+    instance["icosa_asset_id"] = asset_id
+    if matrix is not None:
+        instance.matrix_world = matrix
+    context.view_layer.active_layer_collection.collection.objects.link(instance)
+    return instance
+
+
+def obj_bounds(path):
+    """Bounds of the vertices of an .obj file, read without importing it"""
+    low = [float('inf')] * 3
+    high = [float('-inf')] * 3
+    with open(path, 'r', errors='ignore') as f:
+        for line in f:
+            if not line.startswith('v '):
+                continue
+            for i, value in enumerate(line.split()[1:4]):
+                value = float(value)
+                low[i] = min(low[i], value)
+                high[i] = max(high[i], value)
+    if low[0] == float('inf'):
+        return None
+    return low, high
+
+
+def read_model_bounds(model_path):
+    """Bounds of a downloaded model once imported (Z up), or None if unknown"""
+    try:
+        if model_path.lower().endswith(('.gltf', '.glb')):
+            bounds = gltf_utils.model_bounds(model_path)
+        else:
+            bounds = obj_bounds(model_path)
+    except Exception as e:
+        print("Failed to read the bounds of {}: {}".format(model_path, e))
+        return None
+    return gltf_to_blender_bounds(bounds)
+
+
+def gltf_to_blender_bounds(bounds):
+    if bounds is None:
+        return None
+    # Y up to Z up, as done by the importers: (x, y, z) -> (x, -z, y)
+    low, high = bounds
+    return (low[0], -high[2], low[1]), (high[0], -low[2], high[1])
+
+
+def fetch_model_bounds(main_url, asset_id):
+    """
+    Bounds of a model once imported (Z up), read from its files if they were
+    downloaded already, or else from its glTF JSON only: the whole .gltf file
+    or the JSON chunk at the start of a .glb, the rest of which is not
+    downloaded. None if unknown, such as for zipped models not downloaded yet
+    """
+    main_filename = urllib.parse.urlparse(main_url).path.split('/')[-1]
+    main_resource_path = os.path.join(Config.ICOSA_MODEL_DIR, asset_id, main_filename)
+    if os.path.exists(main_resource_path):
+        if main_filename.endswith('.zip'):
+            model_path = find_extracted_model(os.path.dirname(main_resource_path))
+        else:
+            model_path = main_resource_path
+        return read_model_bounds(model_path) if model_path else None
+
+    try:
+        if main_filename.lower().endswith('.gltf'):
+            r = requests_get(main_url, timeout=Config.PLACEHOLDER_TIMEOUT)
+            r.raise_for_status()
+            return gltf_to_blender_bounds(gltf_utils.scene_bounds(r.json()))
+        if main_filename.lower().endswith('.glb'):
+            with requests_get(main_url, stream=True, timeout=Config.PLACEHOLDER_TIMEOUT) as r:
+                r.raise_for_status()
+                r.raw.decode_content = True
+                json_bytes, _, _ = gltf_utils.read_glb_json_chunk(r.raw)
+            return gltf_to_blender_bounds(gltf_utils.scene_bounds(json.loads(json_bytes.decode('utf-8'))))
+    except Exception as e:
+        print("Failed to fetch the bounds of {}: {}".format(asset_id, e))
+    return None
+
+
+def create_placeholder(context, asset_id, title, main_url, additional_urls, bounds):
+    """
+    Add a wireframe box standing for a model, with its thumbnail as a
+    reference image, to be replaced later by the model itself
+
+    Args:
+        bounds: (min, max) corners of the model, a unit box is used if None
+    """
+    low, high = bounds or ((-0.5, -0.5, 0.0), (0.5, 0.5, 1.0))
+    vertices = [(x, y, z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])]
+    faces = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    mesh = bpy.data.meshes.new('{} (placeholder)'.format(title))
+    mesh.from_pydata(vertices, [], faces)
+
+    placeholder = bpy.data.objects.new(title, mesh)
+    placeholder.display_type = 'WIRE'
+    placeholder["icosa_placeholder"] = True
+    placeholder["icosa_asset_id"] = asset_id
+    placeholder["icosa_title"] = title
+    placeholder["icosa_main_url"] = main_url
+    placeholder["icosa_additional_urls"] = json.dumps(additional_urls)
+    collection = context.view_layer.active_layer_collection.collection
+    collection.objects.link(placeholder)
+
+    thumbnail_path = os.path.join(Config.ICOSA_THUMB_DIR, '{}.png'.format(asset_id))
+    if os.path.exists(thumbnail_path):
+        # Packed, the thumbnail directory being cleaned up
+        image = bpy.data.images.load(thumbnail_path, check_existing=True)
+        if not image.packed_file:
+            image.pack()
+
+        # Standing behind the box, facing the front view
+        reference = bpy.data.objects.new('{} (thumbnail)'.format(title), None)
+        reference.empty_display_type = 'IMAGE'
+        reference.data = image
+        reference.empty_display_size = max(high[0] - low[0], high[2] - low[2])
+        reference.location = ((low[0] + high[0]) / 2, high[1], (low[2] + high[2]) / 2)
+        reference.rotation_euler = (math.radians(90), 0.0, 0.0)
+        reference.parent = placeholder
+        collection.objects.link(reference)
+
+    for obj in context.view_layer.objects.selected:
+        obj.select_set(False)
+    placeholder.select_set(True)
+    context.view_layer.objects.active = placeholder
+    return placeholder
+
+
+def import_placeholder(main_url, additional_urls, asset_id, title):
+    """
+    Fetch the bounds of a model in the background, then add its placeholder
+    from a timer, see fetch_model_bounds and create_placeholder
+    """
+    set_import_status('Fetching model size')
+    result = {}
+
+    def fetch():
+        result['bounds'] = fetch_model_bounds(main_url, asset_id)
+
+    thread = threading.Thread(target=fetch, daemon=True)
+    thread.start()
+
+    def add_placeholder():
+        if thread.is_alive():
+            return 0.1
+        create_placeholder(bpy.context, asset_id, title, main_url, additional_urls, result.get('bounds'))
+        set_import_status('')
+        return None
+
+    bpy.app.timers.register(add_placeholder, first_interval=0.1)
+
+
+def replace_placeholders_stages(context, placeholders):
+    """
+    Replace placeholders with their models. The missing models are
+    downloaded in parallel first, then each model is taken from the file,
+    the .blend cache or imported, once for all its placeholders: the first
+    one gets the model, the others instances of its collection. Yields
+    (stage, progress) like import_model_stages, and context must be
+    bpy.context for the same reason
+
+    Args:
+        placeholders: Dict asset id -> placeholder objects
+
+    Returns:
+        Asset ids which couldn't be replaced
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    cancel_prefetch()
+    instance_assets = get_preference('instanceRepeatedAssets', True)
+    use_cache = get_preference('useBlendCache', True)
+
+    cache_paths = {}
+    downloads = {}
+    for asset_id, objects in placeholders.items():
+        main_url = objects[0]["icosa_main_url"]
+        cache_path = get_asset_cache_path(asset_id, main_url) if use_cache else ''
+        cache_paths[asset_id] = cache_path
+        if instance_assets and find_asset_collection(asset_id) is not None:
+            continue
+        if cache_path and os.path.exists(cache_path):
+            continue
+        downloads[asset_id] = (main_url, json.loads(objects[0]["icosa_additional_urls"]), asset_id)
+
+    # The downloads run in threads, polled between the events
+    executor = ThreadPoolExecutor(max_workers=Config.PLACEHOLDER_DOWNLOAD_WORKERS)
+    try:
+        futures = {asset_id: executor.submit(fetch_model_files, *args) for asset_id, args in downloads.items()}
+        while True:
+            done = sum(future.done() for future in futures.values())
+            if done == len(futures):
+                break
+            yield 'Downloading {} models'.format(len(futures)), done / len(futures)
+        downloaded = {asset_id: future.result() for asset_id, future in futures.items()}
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    failed = []
+    for index, (asset_id, objects) in enumerate(placeholders.items()):
+        yield 'Replacing placeholders', index / len(placeholders)
+        first = objects[0]
+        title = first.get("icosa_title", first.name)
+        cache_path = cache_paths[asset_id]
+        parent = first.users_collection[0]
+        try:
+            # Already in the file, every placeholder gets an instance
+            collection = find_asset_collection(asset_id) if instance_assets else None
+            offset = None
+            if collection is None:
+                if cache_path and os.path.exists(cache_path):
+                    previous = set_active_collection(context, parent)
+                    try:
+                        collection = append_cached_asset(context, cache_path, asset_id)
+                    finally:
+                        context.view_layer.active_layer_collection = previous
+                    if collection is not None:
+                        apply_import_options(context, collection)
+                if collection is None:
+                    if asset_id in downloaded:
+                        main_resource_path = downloaded[asset_id]
+                    else:
+                        # The cached .blend turned out to be invalid
+                        main_resource_path = fetch_model_files(first["icosa_main_url"], json.loads(first["icosa_additional_urls"]), asset_id)
+                    model_path = find_model_file(main_resource_path)
+                    if not model_path:
+                        raise RuntimeError("download failed")
+                    collection = yield from import_model_stages(context, model_path, asset_id, title, cache_path, parent)
+
+                for root in [obj for obj in collection.all_objects if obj.parent is None]:
+                    root.matrix_world = first.matrix_world @ root.matrix_world
+                offset = first.matrix_world.inverted()
+                objects = objects[1:]
+
+            previous = set_active_collection(context, parent)
+            try:
+                for placeholder in objects:
+                    matrix = placeholder.matrix_world if offset is None else placeholder.matrix_world @ offset
+                    add_collection_instance(context, collection, title, asset_id, matrix.copy())
+            finally:
+                context.view_layer.active_layer_collection = previous
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            print("Failed to replace the placeholders of {}: {}".format(asset_id, e))
+            failed.append(asset_id)
+            continue
+
+        removed = list(placeholders[asset_id])
+        removed += [child for placeholder in removed for child in placeholder.children]
+        meshes = [obj.data for obj in removed if obj.type == 'MESH']
+        bpy.data.batch_remove(removed + meshes)
+
+    return failed
+
+
+def remove_collection(collection):
+    """Remove a collection along with its children and objects"""
+    removed = [collection] + list(collection.children_recursive) + list(collection.all_objects)
+    bpy.data.batch_remove(removed)
+
+
+def import_model_stages(context, model_path, asset_id, title, cache_path='', parent=None):
+    """
+    Import a downloaded model into a new collection, and process it: swap its
+    materials from the library, clean its hierarchy and cache the result.
+    Yields (stage, progress) between stages and chunks of work, so that it
+    can be spread over several events, in which case context must be
+    bpy.context: the context given to an operator isn't valid after it
+    returns. Closing the generator removes the partially imported model
+
+    Args:
+        parent: Collection to import into, the active one by default
+
+    Returns:
+        The import collection
+    """
+    set_import_render_engine(context.scene)
+
+    # Import into a dedicated collection, so that the new objects can be
+    # listed without scanning every object of the scene
+    import_collection = create_import_collection(context, title, asset_id, parent)
+    try:
+        is_gltf = model_path.lower().endswith('.gltf') or model_path.lower().endswith('.glb')
+        if is_gltf:
+            yield 'Patching model', 0.0
+            gltf_utils.patch_tilt_brush_uvs(model_path)
+
+            yield 'Importing model', 0.0
+            # The importers link the new objects into the active collection
+            previous = set_active_collection(context, import_collection)
+            try:
+                bpy.ops.import_scene.gltf(filepath=model_path)
+            finally:
+                context.view_layer.active_layer_collection = previous
+            imported_objects = list(import_collection.all_objects)
+
+            # Swap materials from library if configured
+            try:
+                yield from swap_materials_stages(imported_objects)
+            except Exception as e:
+                print(f"Error swapping materials: {e}")
+                import traceback
+                traceback.print_exc()
+
+            yield 'Cleaning hierarchy', 0.0
+            Utils.clean_downloaded_model_dir(asset_id)
+            Utils.clean_node_hierarchy(imported_objects, title)
+        else:
+            yield 'Importing model', 0.0
+            previous = set_active_collection(context, import_collection)
+            try:
+                bpy.ops.wm.obj_import(filepath=model_path, use_split_groups=True)
+            finally:
+                context.view_layer.active_layer_collection = previous
+            imported_objects = list(import_collection.all_objects)
+
+            # Create a parent EMPTY object for all the split groups
+            parent_empty = bpy.data.objects.new(title, None)
+            import_collection.objects.link(parent_empty)
+            for obj in imported_objects:
+                obj.parent = parent_empty
+
+            yield 'Cleaning hierarchy', 0.0
+            Utils.clean_downloaded_model_dir(asset_id)
+            Utils.clean_node_hierarchy([parent_empty] + imported_objects, title)
+
+        if cache_path:
+            yield 'Caching model', 0.0
+            save_asset_to_cache(import_collection, cache_path)
+
+        yield from import_options_stages(context, import_collection)
+
+    except GeneratorExit:
+        print("Import of {} cancelled".format(title))
+        remove_collection(import_collection)
+        raise
+
+    return import_collection
+
+
+def import_model_file(context, model_path, asset_id, title, cache_path=''):
+    """Import and process a downloaded model in one go, see import_model_stages"""
+    import_collection = run_stages(import_model_stages(context, model_path, asset_id, title, cache_path))
+    set_import_status('')
+    return import_collection
+
+
+def import_model(model_path, asset_id, title, cache_path=''):
+    bpy.ops.wm.import_modal('INVOKE_DEFAULT', model_path=model_path, asset_id=asset_id, title=title, cache_path=cache_path)
+
+
+def build_search_request(query, curated, include_tiltbrush, face_count, category, sort_by):
+
+    final_query = '&name={}'.format(query) if query else ''
+
+    if curated:
+        final_query = final_query + '&curated=true'
+
+    if not include_tiltbrush:
+        final_query = final_query + '&format=-TILT'
+
+    if sort_by == 'NEWEST':
+        final_query = final_query + '&orderBy=NEWEST'
+    elif sort_by == 'OLDEST':
+        final_query = final_query + '&orderBy=OLDEST'
+    elif sort_by == 'BEST':
+        final_query = final_query + '&orderBy=BEST'
+    elif sort_by == 'TRIANGLE_COUNT':
+        final_query = final_query + '&orderBy=TRIANGLE_COUNT'
+    elif sort_by == 'LIKED_TIME':
+        final_query = final_query + '&orderBy=LIKED_TIME'
+    elif sort_by == 'CREATE_TIME':
+        final_query = final_query + '&orderBy=CREATE_TIME'
+    elif sort_by == 'UPDATE_TIME':
+        final_query = final_query + '&orderBy=UPDATE_TIME'
+    elif sort_by == 'LIKES':
+        final_query = final_query + '&orderBy=LIKES'
+    elif sort_by == 'DOWNLOADS':
+        final_query = final_query + '&orderBy=DOWNLOADS'
+    elif sort_by == 'DISPLAY_NAME':
+        final_query = final_query + '&orderBy=DISPLAY_NAME'
+    elif sort_by == 'AUTHOR_NAME':
+        final_query = final_query + '&orderBy=AUTHOR_NAME'
+
+    if face_count == '10K':
+        final_query = final_query + '&triangleCountMax=10000'
+    elif face_count == '50K':
+        final_query = final_query + '&triangleCountMin=10000&triangleCountMax=50000'
+    elif face_count == '100K':
+        final_query = final_query + '&triangleCountMin=50000&triangleCountMax=100000'
+    elif face_count == '250K':
+        final_query = final_query + "&triangleCountMin=100000&triangleCountMax=250000"
+    elif face_count == '250KP':
+        final_query = final_query + "&triangleCountMin=250000"
+
+    if category != 'ALL':
+        final_query = final_query + '&category={}'.format(category)
+
+    return final_query
+
+
+def parse_results(r, *args, **kwargs):
+
+    ongoingSearches.discard(r.url)
+
+    icosa_props = get_icosa_props()
+    json_data = r.json()
+
+    if 'current' in icosa_props.search_results:
+        icosa_props.search_results['current'].clear()
+        del icosa_props.search_results['current']
+
+    icosa_props.search_results['current'] = OrderedDict()
+
+    for result in list(json_data.get('assets', [])):
+
+        # Dirty fix to avoid parsing obsolete data
+        if 'current' not in icosa_props.search_results:
+            return
+
+        asset_id = result['assetId']
+        icosa_props.search_results['current'][result['assetId']] = IcosaModel(result)
+
+        if not os.path.exists(os.path.join(Config.ICOSA_THUMB_DIR, asset_id) + '.png'):
+            icosa_props.icosa_api.request_thumbnail(result['thumbnail'], asset_id)
+        elif asset_id not in icosa_props.custom_icons:
             icosa_props.custom_icons.load(asset_id, os.path.join(Config.ICOSA_THUMB_DIR, "{}.png".format(asset_id)), 'IMAGE')
 
         # Make a request to get the download_size for own models
@@ -1400,132 +2811,409 @@ class LoginModal(bpy.types.Operator):
             set_login_status(f'ERROR', f'Device code failed: {r.status_code} {r.text}')
             print('Cannot login.\n {}'.format(r.json()))
 
-        self.is_logging = False
+        self.is_logging = False
+
+    def handle_token_login(self, api_token):
+        browser_props = get_icosa_props()
+        browser_props.icosa_api.api_token = api_token
+        login_props = get_icosa_login_props()
+        Cache.save_key('api_token', login_props.api_token)
+
+        browser_props.icosa_api.build_headers()
+        set_login_status('INFO', '')
+        browser_props.icosa_api.request_user_info()
+        self.is_logging = False
+
+    def modal(self, context, event):
+        if self.error:
+            self.error = False
+            set_login_status('ERROR', 'Modal: {}'.format(self.error_message))
+            return {"FINISHED"}
+
+        if self.is_logging:
+            set_login_status('FILE_REFRESH', 'Logging in to your Icosa Gallery account...')
+            return {'RUNNING_MODAL'}
+        else:
+            return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.is_logging = True
+        try:
+            context.window_manager.modal_handler_add(self)
+            login_props = get_icosa_login_props()
+
+            # if login_props.use_mail:
+            #     data = {
+            #         'grant_type': 'password',
+            #         # 'client_id': Config.CLIENTID,
+            #         'username': login_props.email,
+            #         'password': login_props.password,
+            #     }
+            #     requests.post(Config.ICOSA_EMAIL_AUTH, data=data, hooks={'response': self.handle_mail_login})
+
+            if login_props.use_device_code:
+                url = f"{Config.ICOSA_DEVICE_AUTH}?device_code={login_props.device_code}"
+                requests.post(url, hooks={'response': self.handle_device_login})
+
+            else:
+                self.handle_token_login(login_props.api_token)
+        except Exception as e:
+            self.error = True
+            self.error_message = str(e)
+
+        return {'RUNNING_MODAL'}
+
+
+def event_in_area(context, event, area_type):
+    """Whether the mouse was over an area of this type when the event happened"""
+    screen = context.window.screen if context.window else None
+    for area in screen.areas if screen else []:
+        if (area.type == area_type and area.x <= event.mouse_x < area.x + area.width
+                and area.y <= event.mouse_y < area.y + area.height):
+            return True
+    return False
+
+
+class ImportModalOperator(bpy.types.Operator):
+    """Imports the selected model into Blender"""
+    bl_idname = "wm.import_modal"
+    bl_label = "Import 3d model to Icosa Gallery"
+    bl_options = {'INTERNAL'}
+
+    model_path: StringProperty()
+    asset_id: StringProperty()
+    title: StringProperty()
+    cache_path: StringProperty()
+
+    _timer = None
+    _stages = None
+
+    def execute(self, context):
+        print('IMPORT')
+        return {'FINISHED'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS' and event_in_area(context, event, 'VIEW_3D'):
+            self.cancel(context)
+            self.report({'INFO'}, "Import cancelled")
+            return {'CANCELLED'}
+
+        # Undoing would free the data the remaining stages still hold
+        if event.type in {'Z', 'Y'} and (event.ctrl or event.oskey):
+            return {'RUNNING_MODAL'}
+
+        if event.type != 'TIMER' or event.timer is not self._timer:
+            return {'PASS_THROUGH'}
+
+        try:
+            stage, progress = next(self._stages)
+            set_import_status('{} {}%...'.format(stage, int(min(progress, 1.0) * 100)))
+            self.redraw(context)
+            return {'RUNNING_MODAL'}
+        except StopIteration:
+            pass
+        except Exception:
+            import traceback
+            print(traceback.format_exc())
+
+        self.finish(context)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        # The stages run over the next timer events, after this context is gone
+        self._stages = import_model_stages(bpy.context, self.model_path, self.asset_id, self.title, self.cache_path)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(Config.IMPORT_STAGE_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        set_import_status('Importing...')
+        return {'RUNNING_MODAL'}
+
+    def redraw(self, context):
+        for area in context.screen.areas if context.screen else []:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        set_import_status('')
+        self.redraw(context)
+
+    def cancel(self, context):
+        try:
+            self._stages.close()
+        except Exception:
+            import traceback
+            print(traceback.format_exc())
+        self.finish(context)
+
+
+class IcosaSwapLOD(bpy.types.Operator):
+    """Swap imported models between their decimated and full resolution meshes
+    Applies to the selected objects, or to the whole scene if nothing is selected"""
+    bl_idname = "wm.icosa_swap_lod"
+    bl_label = "Swap model resolution"
+    bl_options = {'INTERNAL', 'UNDO'}
+
+    full_resolution: BoolProperty(default=False)
+
+    def execute(self, context):
+        objects = context.selected_objects or context.scene.objects
+        swapped = 0
+        for obj in objects:
+            mesh = obj.get("icosa_full_mesh" if self.full_resolution else "icosa_lod_mesh")
+            if mesh is not None and obj.data != mesh:
+                obj.data = mesh
+                swapped += 1
+        self.report({'INFO'}, "Swapped {} meshes".format(swapped))
+        return {'FINISHED'}
+
+
+class IcosaRestoreTextures(bpy.types.Operator):
+    """Point the images using proxy textures back to their full resolution files"""
+    bl_idname = "wm.icosa_restore_textures"
+    bl_label = "Restore full resolution textures"
+    bl_options = {'INTERNAL', 'UNDO'}
+
+    def execute(self, context):
+        restored, missing = restore_proxy_textures(bpy.data.images)
+        if missing:
+            self.report({'WARNING'}, "Restored {} textures, full resolution files are missing for: {}".format(restored, ', '.join(missing)))
+        else:
+            self.report({'INFO'}, "Restored {} textures".format(restored))
+        return {'FINISHED'}
+
+
+class IcosaUnmerge(bpy.types.Operator):
+    """Replace merged objects with the original objects they were joined from
+    Applies to the selected objects, or to the whole scene if nothing is selected"""
+    bl_idname = "wm.icosa_unmerge"
+    bl_label = "Unmerge objects"
+    bl_options = {'INTERNAL', 'UNDO'}
+
+    def execute(self, context):
+        objects = context.selected_objects or context.scene.objects
+        restored = unmerge_objects([obj for obj in objects if "icosa_unmerged_collection" in obj])
+        self.report({'INFO'}, "Restored {} objects".format(restored))
+        return {'FINISHED'}
+
+
+class IcosaReplacePlaceholders(bpy.types.Operator):
+    """Replace every placeholder of the scene with its model"""
+    bl_idname = "wm.icosa_replace_placeholders"
+    bl_label = "Replace placeholders"
+    bl_options = {'INTERNAL', 'UNDO'}
+
+    _timer = None
+    _stages = None
+    _count = 0
 
-    def handle_token_login(self, api_token):
-        browser_props = get_icosa_props()
-        browser_props.icosa_api.api_token = api_token
-        login_props = get_icosa_login_props()
-        Cache.save_key('api_token', login_props.api_token)
+    def invoke(self, context, event):
+        placeholders = defaultdict(list)
+        for obj in context.scene.objects:
+            if obj.get("icosa_placeholder"):
+                placeholders[obj["icosa_asset_id"]].append(obj)
+        if not placeholders:
+            self.report({'INFO'}, "No placeholders in the scene")
+            return {'CANCELLED'}
 
-        browser_props.icosa_api.build_headers()
-        set_login_status('INFO', '')
-        browser_props.icosa_api.request_user_info()
-        self.is_logging = False
+        # The stages run over the next timer events, after this context is gone
+        self._count = len(placeholders)
+        self._stages = replace_placeholders_stages(bpy.context, placeholders)
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(Config.IMPORT_STAGE_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        set_import_status('Replacing placeholders...')
+        return {'RUNNING_MODAL'}
 
     def modal(self, context, event):
-        if self.error:
-            self.error = False
-            set_login_status('ERROR', 'Modal: {}'.format(self.error_message))
-            return {"FINISHED"}
+        if event.type == 'ESC' and event.value == 'PRESS' and event_in_area(context, event, 'VIEW_3D'):
+            self.cancel(context)
+            self.report({'INFO'}, "Placeholder replacement cancelled")
+            return {'CANCELLED'}
 
-        if self.is_logging:
-            set_login_status('FILE_REFRESH', 'Logging in to your Icosa Gallery account...')
+        # Undoing would free the data the remaining stages still hold
+        if event.type in {'Z', 'Y'} and (event.ctrl or event.oskey):
             return {'RUNNING_MODAL'}
-        else:
-            return {'FINISHED'}
 
-    def invoke(self, context, event):
-        self.is_logging = True
-        try:
-            context.window_manager.modal_handler_add(self)
-            login_props = get_icosa_login_props()
+        if event.type != 'TIMER' or event.timer is not self._timer:
+            return {'PASS_THROUGH'}
 
-            # if login_props.use_mail:
-            #     data = {
-            #         'grant_type': 'password',
-            #         # 'client_id': Config.CLIENTID,
-            #         'username': login_props.email,
-            #         'password': login_props.password,
-            #     }
-            #     requests.post(Config.ICOSA_EMAIL_AUTH, data=data, hooks={'response': self.handle_mail_login})
+        failed = None
+        try:
+            stage, progress = next(self._stages)
+            set_import_status('{} {}%...'.format(stage, int(min(progress, 1.0) * 100)))
+            return {'RUNNING_MODAL'}
+        except StopIteration as done:
+            failed = done.value
+        except Exception:
+            import traceback
+            print(traceback.format_exc())
 
-            if login_props.use_device_code:
-                url = f"{Config.ICOSA_DEVICE_AUTH}?device_code={login_props.device_code}"
-                requests.post(url, hooks={'response': self.handle_device_login})
+        self.finish(context)
+        if failed is None:
+            self.report({'ERROR'}, "Failed to replace the placeholders")
+        elif failed:
+            self.report({'ERROR'}, "Failed to replace the placeholders of: {}".format(', '.join(failed)))
+        else:
+            self.report({'INFO'}, "Replaced the placeholders of {} models".format(self._count))
+        return {'FINISHED'}
 
-            else:
-                self.handle_token_login(login_props.api_token)
-        except Exception as e:
-            self.error = True
-            self.error_message = str(e)
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        set_import_status('')
 
-        return {'RUNNING_MODAL'}
+    def cancel(self, context):
+        try:
+            self._stages.close()
+        except Exception:
+            import traceback
+            print(traceback.format_exc())
+        self.finish(context)
 
 
-class ImportModalOperator(bpy.types.Operator):
-    """Imports the selected model into Blender"""
-    bl_idname = "wm.import_modal"
-    bl_label = "Import 3d model to Icosa Gallery"
+class BackgroundImportOperator(bpy.types.Operator):
+    """Converts a model in a background Blender process, then appends the result"""
+    bl_idname = "wm.icosa_background_import"
+    bl_label = "Import 3d model in the background"
     bl_options = {'INTERNAL'}
 
-    model_path: StringProperty()
     asset_id: StringProperty()
     title: StringProperty()
+    main_url: StringProperty()
+    additional_urls: StringProperty(default="[]")
+    cache_path: StringProperty()
 
-    def execute(self, context):
-        print('IMPORT')
-        return {'FINISHED'}
+    _timer = None
+    _process = None
+    _job_path = ''
+    _result_path = ''
+
+    # Assets being converted in the background
+    running = set()
+
+    def invoke(self, context, event):
+        if self.asset_id in BackgroundImportOperator.running:
+            self.report({'INFO'}, "This model is already being imported")
+            return {'CANCELLED'}
+
+        BackgroundImportOperator.running.add(self.asset_id)
+        set_import_status('Importing in the background ({})'.format(len(BackgroundImportOperator.running)))
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.5, window=context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def start(self):
+        from . import batch_import
+
+        job_dir = tempfile.mkdtemp()
+        self._job_path = os.path.join(job_dir, 'job.json')
+        self._result_path = os.path.join(job_dir, 'result.json')
+        with open(self._job_path, 'w') as f:
+            json.dump({
+                'assets': [{
+                    'asset_id': self.asset_id,
+                    'title': self.title,
+                    'main_url': self.main_url,
+                    'additional_urls': json.loads(self.additional_urls),
+                    'output': self.cache_path,
+                }],
+                'overwrite': True,
+                'fake_user': False,
+                'result': self._result_path,
+            }, f)
+
+        command = batch_import.worker_command(self._job_path, get_material_library_path(),
+                                              get_preference('materialLinkMode', 'REUSE'), get_temporary_path())
+        self._process = subprocess.Popen(command)
 
     def modal(self, context, event):
-        if bpy.context.scene.render.engine not in ["CYCLES", "BLENDER_EEVEE_NEXT"]:
-            bpy.context.scene.render.engine = "BLENDER_EEVEE_NEXT"
+        if event.type != 'TIMER' or event.timer is not self._timer:
+            return {'PASS_THROUGH'}
+
+        # Let a speculative download finish rather than starting a second one
+        if self._process is None:
+            if not prefetch_pending(self.asset_id):
+                self.start()
+            return {'PASS_THROUGH'}
+
+        if self._process.poll() is None:
+            return {'PASS_THROUGH'}
+
+        self.finish(context)
         try:
-            old_objects = [o.name for o in bpy.data.objects]  # Get the current objects in order to find the new node hierarchy
-
-            # Blender doesn't support uv channels with 3 or 4 components
-            # Legacy Tilt files from Poly are using 3 or 4 components for uv channels
-            # If we prepend "_" to those channels, Blender will treat them as custom channels
-            is_gltf = self.model_path.lower().endswith('.gltf') or self.model_path.lower().endswith('.glb')
-            if is_gltf:
-                with open(self.model_path, 'r') as f:
-                    asset_json = json.load(f)
-                if "GOOGLE_tilt_brush_techniques" in asset_json["extensions"]:
-                    for mesh in asset_json["meshes"]:
-                        for primitive in mesh["primitives"]:
-                            # Rename the key "TEX_COORD_0" to "_TEXCOORD_0"
-                            if "TEXCOORD_0" in primitive["attributes"]:
-                                primitive["attributes"]["_TEXCOORD_0"] = primitive["attributes"].pop("TEXCOORD_0")
-                            if "TEXCOORD_0" in primitive["attributes"]:
-                                primitive["attributes"]["_TEXCOORD_1"] = primitive["attributes"].pop("TEXCOORD_0")
-
-                    with open(self.model_path, 'w') as f:
-                        json.dump(asset_json, f, indent=4)
-                # Import the model
-                bpy.ops.import_scene.gltf(filepath=self.model_path)
-                imported_objects = [o for o in bpy.data.objects if o.name not in old_objects]
-                # Swap materials from library if configured
-                swap_materials_from_library(imported_objects, self.asset_id)
-                set_import_status('')
-                Utils.clean_downloaded_model_dir(self.asset_id)
-                Utils.clean_node_hierarchy(imported_objects, self.title)
-            else:
-                bpy.ops.wm.obj_import(filepath=self.model_path, use_split_groups=True)
-                imported_objects = [o for o in bpy.data.objects if o.name not in old_objects]
+            with open(self._result_path, 'r') as f:
+                result = json.load(f).get(self.asset_id, {})
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+
+            collection = append_cached_asset(context, self.cache_path, self.asset_id)
+            if collection is None:
+                raise RuntimeError("no imported collection found")
+            apply_import_options(context, collection)
+            if not get_preference('useBlendCache', True):
+                os.remove(self.cache_path)
+        except Exception as e:
+            self.report({'ERROR'}, "Background import of {} failed: {}".format(self.title, e))
 
-                # Create a parent EMPTY object for all the split groups
-                parent_empty = bpy.data.objects.new(self.title, None)
-                bpy.context.collection.objects.link(parent_empty)
-                for obj in imported_objects:
-                    obj.parent = parent_empty
+        if context.area:
+            context.area.tag_redraw()
+        return {'FINISHED'}
 
-                set_import_status('')
-                Utils.clean_downloaded_model_dir(self.asset_id)
-                Utils.clean_node_hierarchy([parent_empty] + imported_objects, self.title)
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        BackgroundImportOperator.running.discard(self.asset_id)
+        running = len(BackgroundImportOperator.running)
+        set_import_status('Importing in the background ({})'.format(running) if running else '')
+        if self._job_path:
+            shutil.rmtree(os.path.dirname(self._job_path), ignore_errors=True)
 
-            return {'FINISHED'}
+    def cancel(self, context):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+        self.finish(context)
 
-        except Exception:
-            import traceback
-            print(traceback.format_exc())
-            set_import_status('')
-            return {'FINISHED'}
+
+class IcosaWaitForPrefetch(bpy.types.Operator):
+    """Waits for the speculative download of a model, then imports it"""
+    bl_idname = "wm.icosa_wait_prefetch"
+    bl_label = "Wait for the model download"
+    bl_options = {'INTERNAL'}
+
+    asset_id: StringProperty()
+    title: StringProperty()
+    main_url: StringProperty()
+    additional_urls: StringProperty(default="[]")
+
+    _timer = None
 
     def invoke(self, context, event):
-        context.window_manager.modal_handler_add(self)
-        set_import_status('Importing...')
+        set_import_status('Downloading...')
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(Config.IMPORT_STAGE_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
         return {'RUNNING_MODAL'}
 
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS' and event_in_area(context, event, 'VIEW_3D'):
+            cancel_prefetch()
+            self.cancel(context)
+            self.report({'INFO'}, "Import cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER' or event.timer is not self._timer or prefetch_pending(self.asset_id):
+            return {'PASS_THROUGH'}
+
+        self.cancel(context)
+        context.window_manager.icosa_browser.icosa_api.get_download(
+            self.main_url, json.loads(self.additional_urls), self.asset_id, self.title)
+        return {'FINISHED'}
+
+    def cancel(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        set_import_status('')
+
 
 class GetRequestThread(threading.Thread):
     def __init__(self, url, callback, headers={}):
@@ -1745,6 +3433,7 @@ class IcosaBrowse(View3DPanel, bpy.types.Panel):
         self.layout.enabled = get_plugin_enabled()
         self.draw_search(self.layout, context)
         self.draw_results(self.layout, context)
+        draw_import_options(self.layout, context)
 
     def invoke(self, context, event):
         wm = context.window_manager
@@ -1769,6 +3458,25 @@ class IcosaExportPanel(View3DPanel, bpy.types.Panel):
 
         # Selection only
         layout.prop(props, "selection")
+        layout.prop(props, "fit_upload_limit")
+        col = layout.column(align=True)
+        col.prop(props, "optimize_textures")
+        row = col.row()
+        row.enabled = props.optimize_textures
+        row.prop(props, "max_texture_size")
+
+        # Thumbnail
+        col = layout.column(align=True)
+        col.prop(props, "thumbnail_mode")
+        if props.thumbnail_mode == 'FILE':
+            col.prop(props, "thumbnail_file", text="")
+        else:
+            row = col.row(align=True)
+            row.prop(props, "thumbnail_width")
+            row.prop(props, "thumbnail_height")
+            if props.thumbnail_mode == 'EEVEE':
+                col.prop(props, "thumbnail_samples")
+            col.prop(props, "thumbnail_frame")
 
         # Upload button
         row = layout.row()
@@ -1781,16 +3489,39 @@ class IcosaExportPanel(View3DPanel, bpy.types.Panel):
                 upload_label = "Log in to upload models"
             elif bpy.context.mode != 'OBJECT':
                 upload_label = "Export is only available in object mode"
-        if sf_state.uploading:
-            upload_label = "Uploading %s" % sf_state.size_label
+        if sf_state.exporting:
+            upload_label = "%s... (Esc to cancel)" % sf_state.export_stage
+            upload_icon  = "SORTTIME"
+        elif sf_state.uploading:
+            upload_label = "Uploading %s / %s (Esc to cancel)" % (Utils.humanify_size(sf_state.upload_sent), sf_state.size_label)
+            if sf_state.upload_attempt > 1:
+                upload_label = "Attempt %d: %s" % (sf_state.upload_attempt, upload_label)
             upload_icon  = "SORTTIME"
         row.operator("wm.icosa_export", icon=upload_icon, text=upload_label)
 
+        # Package of a failed upload
+        pending = sf_state.pending_upload if not (sf_state.uploading or sf_state.exporting) else None
+        if pending:
+            row = layout.row(align=True)
+            row.operator("wm.icosa_export", text="Retry upload (%s)" % Utils.humanify_size(pending['size']), icon='FILE_REFRESH').retry = True
+            row.operator("wm.icosa_discard_upload", text="", icon='X')
+
         publish_url = sf_state.publish_url
         if publish_url:
             layout.operator("wm.url_open", text="Edit or Publish", icon='URL').url = publish_url
 
 
+class IcosaDiscardUpload(bpy.types.Operator):
+    """Delete the package kept from a failed upload"""
+    bl_idname = "wm.icosa_discard_upload"
+    bl_label = "Discard failed upload"
+    bl_options = {'INTERNAL'}
+
+    def execute(self, context):
+        clear_pending_upload()
+        return {'FINISHED'}
+
+
 class IcosaLogger(bpy.types.Operator):
     """Log in / out your Icosa Gallery account"""
     bl_idname = 'wm.icosa_login'
@@ -1869,10 +3600,19 @@ class IcosaModel:
         # else:
         #     self.download_size = None
 
+        # Filled in from the downloaded model file, see inspect_model_file
+        self.inspection = None
+
         self.info_requested = True  # We no longer need to request the model info
         self.time_url_requested = None
         self.url_expires = None
 
+    def get_urls(self):
+        """Main url to download, and the additional resources it needs"""
+        if self.zip_archive_url:
+            return self.zip_archive_url, []
+        return self.download_url, list(self.resource_urls)
+
 
 def ShowMessage(icon="INFO", title="Info", message="Information"):
     def draw(self, context):
@@ -2083,30 +3823,191 @@ class IcosaExportProps(bpy.types.PropertyGroup):
             description="Determines which meshes are exported",
             default=False,
             )
+    fit_upload_limit: BoolProperty(
+            name="Fit in upload limit",
+            description="Compress meshes, and scale down and re-encode textures, as much as needed for the model to fit in your plan upload limit",
+            default=True,
+            )
+    optimize_textures: BoolProperty(
+            name="Optimize textures",
+            description="Merge identical images, cap their resolution and save opaque color ones as JPEG",
+            default=True,
+            )
+    max_texture_size: EnumProperty(
+            name="Max texture size",
+            items=(
+                ('1024', "1024", ""),
+                ('2048', "2048", ""),
+                ('4096', "4096", ""),
+                ('8192', "8192", ""),
+                ('0', "Original", "Keep the resolution of the images"),
+            ),
+            description="Images larger than this are scaled down on export",
+            default='4096',
+            )
+    thumbnail_mode: EnumProperty(
+            name="Thumbnail",
+            items=(
+                ('WORKBENCH', "Workbench", "Fast render with the Workbench engine"),
+                ('EEVEE', "EEVEE", "Render with EEVEE and the given number of samples"),
+                ('SCENE', "Scene", "Render with the engine and settings of the scene"),
+                ('FILE', "Image", "Use an existing image"),
+            ),
+            description="How the thumbnail of the model is made",
+            default='WORKBENCH',
+            )
+    thumbnail_width: IntProperty(
+            name="Width",
+            default=1280,
+            min=64,
+            max=4096,
+            )
+    thumbnail_height: IntProperty(
+            name="Height",
+            default=720,
+            min=64,
+            max=4096,
+            )
+    thumbnail_samples: IntProperty(
+            name="Samples",
+            default=16,
+            min=1,
+            max=1024,
+            )
+    thumbnail_frame: BoolProperty(
+            name="Frame exported objects",
+            description="Render from a camera framing the exported objects instead of the scene camera",
+            default=True,
+            )
+    thumbnail_file: StringProperty(
+            name="Image",
+            description="Image used as the thumbnail",
+            subtype='FILE_PATH',
+            )
 
 
 class _IcosaState:
     """Singleton to store state"""
     __slots__ = (
         "uploading",
+        "exporting",
+        "export_stage",
         "size_label",
         "model_url",
         "publish_url",
         "report_message",
         "report_type",
+        "upload_sent",
+        "upload_total",
+        "upload_attempt",
+        "upload_cancel",
+        "pending_upload",
         )
 
     def __init__(self):
         self.uploading = False
+        self.exporting = False
+        self.export_stage = ""
         self.size_label = ""
         self.model_url = ""
         self.publish_url = ""
         self.report_message = ""
         self.report_type = ''
+        self.upload_sent = 0
+        self.upload_total = 0
+        self.upload_attempt = 0
+        self.upload_cancel = threading.Event()
+        # Record of the package of a failed upload, see load_pending_upload
+        self.pending_upload = None
 
 sf_state = _IcosaState()
 del _IcosaState
 
+persistent_worker = None
+
+
+class ExportThread(threading.Thread):
+    """
+    Runs pack_for_export on a saved copy of the file, in the persistent export
+    worker if enabled, falling back to a new Blender process if it died.
+    The stage reported by the export is kept in sf_state.export_stage
+    """
+    def __init__(self, blend_path, tempdir, use_worker):
+        self.blend_path = blend_path
+        self.tempdir = tempdir
+        self.use_worker = use_worker
+        self.process = None
+        # Processes started by the export process
+        self.children = set()
+        self.error = None
+        self.cancelled = threading.Event()
+        threading.Thread.__init__(self, daemon=True)
+
+    def set_stage(self, stage):
+        sf_state.export_stage = stage
+
+    def run(self):
+        from . import export_worker
+
+        try:
+            if self.use_worker:
+                try:
+                    persistent_worker.export(self.blend_path, self.tempdir, self.set_stage)
+                    return
+                except export_worker.WorkerError as e:
+                    if self.cancelled.is_set():
+                        return
+                    print("{}, exporting in a new process".format(e))
+            self.run_process()
+        except Exception as e:
+            self.error = e
+
+    def run_process(self):
+        script_path = os.path.dirname(os.path.realpath(__file__))
+        self.process = subprocess.Popen([
+                bpy.app.binary_path,
+                "--background",
+                "-noaudio",
+                self.blend_path,
+                "--python", os.path.join(script_path, "pack_for_export.py"),
+                "--", self.tempdir
+                ], stdout=subprocess.PIPE, text=True, bufsize=1)
+        if self.cancelled.is_set():
+            self.process.kill()
+
+        from . import export_worker
+
+        for line in self.process.stdout:
+            if line.startswith(export_worker.CHILD_PREFIX):
+                export_worker.track_child(line, self.children)
+            elif line.startswith("ICOSA_PROGRESS"):
+                self.set_stage(line[len("ICOSA_PROGRESS"):].strip())
+            else:
+                print(line, end='')
+        returncode = self.process.wait()
+        if returncode != 0 and not self.cancelled.is_set():
+            raise RuntimeError("Export process exited with code {}".format(returncode))
+
+    def cancel(self):
+        """Kill the process running the export, and the ones it started"""
+        from . import export_worker
+
+        self.cancelled.set()
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.kill()
+            export_worker.kill_children(self.children)
+        elif self.use_worker:
+            stop_export_worker()
+
+
+def stop_export_worker():
+    global persistent_worker
+    if persistent_worker is not None:
+        persistent_worker.stop()
+        persistent_worker = None
+
+
 # remove file copy
 def terminate(filepath):
     tempdir = os.path.dirname(filepath)
@@ -2118,37 +4019,206 @@ def upload_report(report_message, report_type):
     sf_state.report_type = report_type
 
 
-def upload_as_multipart(filepath, filename):
-    """Upload file using multipart form encoding instead of JSON"""
-    props = get_icosa_props()
-    api = props.icosa_api
+class UploadCancelled(Exception):
+    pass
 
-    # Create form data
-    form = {
-        "files": (filename, open(filepath, 'rb'), 'application/zip')
-    }
 
-    _headers = api.headers.copy()
-    # Don't set Content-Type as requests will set it automatically with the boundary
+class MultipartEncoder:
+    """
+    File-like multipart/form-data body, reading the files it holds in chunks
+    as requests sends it, so that the whole body is never held in memory
 
-    modelUid = ""
-    requestFunction = requests.post
-    uploadUrl = Config.ICOSA_UPLOAD
+    Args:
+        fields: List of (name, filename, opened binary file or zip_stream.ZipStream, content type)
+        on_progress: Called with the number of bytes read and the total length
+        cancel_event: threading.Event making the next read raise UploadCancelled
+    """
+    def __init__(self, fields, on_progress=None, cancel_event=None):
+        self.boundary = os.urandom(16).hex()
+        self.content_type = 'multipart/form-data; boundary={}'.format(self.boundary)
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+
+        self.parts = []
+        self.length = 0
+        for name, filename, f, content_type in fields:
+            header = '--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\nContent-Type: {}\r\n\r\n'.format(
+                self.boundary, name, filename, content_type).encode('utf-8')
+            self.add_part(header, len(header))
+            self.add_part(f, len(f) if isinstance(f, zip_stream.ZipStream) else os.fstat(f.fileno()).st_size - f.tell())
+            self.add_part(b'\r\n', 2)
+        footer = '--{}--\r\n'.format(self.boundary).encode('utf-8')
+        self.add_part(footer, len(footer))
+
+        self.index = 0
+        self.offset = 0
+        self.position = 0
+
+    def add_part(self, part, length):
+        self.parts.append(part)
+        self.length += length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise UploadCancelled()
+        if size is None or size < 0:
+            size = self.length - self.position
+
+        chunks = []
+        while size > 0 and self.index < len(self.parts):
+            part = self.parts[self.index]
+            if isinstance(part, bytes):
+                data = part[self.offset:self.offset + size]
+                self.offset += len(data)
+            else:
+                data = part.read(size)
+            if not data:
+                self.index += 1
+                self.offset = 0
+                continue
+            chunks.append(data)
+            size -= len(data)
 
-    # Upload and parse the result
+        data = b''.join(chunks)
+        self.position += len(data)
+        if self.on_progress is not None:
+            self.on_progress(self.position, self.length)
+        return data
+
+
+def record_upload_throughput(size, seconds):
+    """Keep the throughput of the last uploads in the cache, for diagnostics"""
+    throughput = size / seconds if seconds > 0 else 0
+    print("Uploaded {} in {:.1f}s ({}/s)".format(Utils.humanify_size(size), seconds, Utils.humanify_size(throughput)))
     try:
+        history = Cache.get_key('upload_history') or []
+        history.append({'time': time.time(), 'size': size, 'seconds': seconds, 'bytes_per_second': throughput})
+        Cache.save_key('upload_history', history[-Config.UPLOAD_HISTORY_LENGTH:])
+    except Exception as e:
+        print("Failed to record the upload throughput: {}".format(e))
+
+
+def save_pending_upload(directory, members, filename, size):
+    """Keep track of a packaged export until its upload is confirmed, so that it can be retried"""
+    sf_state.pending_upload = {
+        'directory': directory,
+        'members': members,
+        'filename': filename,
+        'size': size,
+        'time': time.time(),
+        'error': '',
+    }
+    Cache.save_key('pending_upload', sf_state.pending_upload)
+
+
+def get_pending_upload():
+    pending = Cache.get_key('pending_upload')
+    # Records of zips written by older versions have no members
+    if pending and not (pending.get('members') and all(os.path.exists(m['path']) for m in pending['members'])):
+        clear_pending_upload()
+        return None
+    return pending
+
+
+def load_pending_upload():
+    """Keep the pending upload in sf_state, which is read when drawing instead of the cache"""
+    sf_state.pending_upload = get_pending_upload()
+
+
+def clear_pending_upload():
+    pending = Cache.get_key('pending_upload')
+    if pending:
+        if os.path.isdir(pending.get('directory', '')):
+            shutil.rmtree(pending['directory'])
+        elif os.path.isfile(pending.get('filepath', '')):
+            os.remove(pending['filepath'])
+        Cache.delete_key('pending_upload')
+    sf_state.pending_upload = None
 
-        r = requestFunction(
-            uploadUrl,
-            files=form,
-            headers=_headers
+
+def post_multipart(members, filename):
+    """Post the zip of the members as a streamed multipart form, see MultipartEncoder"""
+    api = get_icosa_props().icosa_api
+
+    def on_progress(sent, total):
+        sf_state.upload_sent = sent
+        sf_state.upload_total = total
+
+    with zip_stream.ZipStream(members) as f:
+        # Stream the form data from the member files
+        body = MultipartEncoder([("files", filename, f, 'application/zip')], on_progress, sf_state.upload_cancel)
+        _headers = api.headers.copy()
+        _headers['Content-Type'] = body.content_type
+
+        start = time.perf_counter()
+        r = requests.post(
+            Config.ICOSA_UPLOAD,
+            data=body,
+            headers=_headers,
+            timeout=(Config.UPLOAD_CONNECT_TIMEOUT, Config.UPLOAD_READ_TIMEOUT)
         )
-    except requests.exceptions.RequestException as e:
-        return upload_report("Upload failed. Error: %s" % str(e), 'WARNING')
+        record_upload_throughput(len(body), time.perf_counter() - start)
+    return r
+
+
+def upload_as_multipart(members, filename):
+    """
+    Upload the package using multipart form encoding instead of JSON, retrying
+    with an exponential backoff only when the server can't have created the
+    asset: the connection failed before any of the package was sent, or the
+    server turned the request down as too many. Posting isn't idempotent, so
+    other failures are left to the user, who can check the gallery before
+    retrying. The API has no resumable upload, so each attempt sends the
+    whole package again
+    """
+    modelUid = ""
+    error = ""
+
+    # Upload and parse the result
+    for attempt in range(Config.UPLOAD_ATTEMPTS):
+        sf_state.upload_attempt = attempt + 1
+        if attempt:
+            delay = Config.UPLOAD_RETRY_DELAY * 2 ** (attempt - 1)
+            print("Upload failed ({}), retrying in {}s".format(error, delay))
+            if sf_state.upload_cancel.wait(delay):
+                return upload_report("Upload cancelled", 'INFO')
+
+        sf_state.upload_sent = 0
+        try:
+            r = post_multipart(members, filename)
+        except UploadCancelled:
+            return upload_report("Upload cancelled", 'INFO')
+        except requests.exceptions.RequestException as e:
+            if sf_state.upload_cancel.is_set():
+                return upload_report("Upload cancelled", 'INFO')
+            error = "Error: %s" % str(e)
+            r = None
+            never_sent = isinstance(e, requests.exceptions.ConnectTimeout) or (
+                isinstance(e, requests.exceptions.ConnectionError) and not sf_state.upload_sent)
+            if never_sent:
+                continue
+            break
 
-    if r.status_code not in [requests.codes.ok, requests.codes.created, requests.codes.no_content]:
-        return upload_report("Upload failed. Error code: %s\nMessage:\n%s" % (str(r.status_code), str(r)), 'WARNING')
+        if r.status_code in [requests.codes.ok, requests.codes.created, requests.codes.no_content]:
+            break
+        error = "Error code: %s\nMessage:\n%s" % (str(r.status_code), str(r))
+        if r.status_code != requests.codes.too_many_requests:
+            break
+    else:
+        r = None
+
+    if r is None or r.status_code not in [requests.codes.ok, requests.codes.created, requests.codes.no_content]:
+        pending = Cache.get_key('pending_upload')
+        if pending:
+            pending['error'] = error
+            Cache.save_key('pending_upload', pending)
+            sf_state.pending_upload = pending
+        return upload_report("Upload failed. %s\nThe package is kept: if the model is missing from your models on Icosa Gallery, retry the upload from the Export panel." % error, 'WARNING')
     else:
+        clear_pending_upload()
         try:
             result = r.json()
             sf_state.model_url = Config.ICOSA_URL + "/view/" + result["assetId"]
@@ -2169,87 +4239,168 @@ class ExportIcosa(bpy.types.Operator):
     bl_idname = "wm.icosa_export"
     bl_label = "Upload"
 
+    retry: BoolProperty(default=False, options={'SKIP_SAVE'})
+
     _timer = None
     _thread = None
+    _export = None
+    _tempdir = ''
+    _blend_path = ''
 
     def modal(self, context, event):
-        if event.type == 'TIMER':
-            if not self._thread.is_alive():
-                wm = context.window_manager
-                props = wm.icosa_export
-
-                terminate(props.filepath)
+        # The export may not be started yet, waiting for the first timer event
+        if event.type == 'ESC' and sf_state.exporting:
+            self.cancel(context)
+            self.report({'INFO'}, "Export cancelled")
+            return {'CANCELLED'}
 
-                if context.area:
-                    context.area.tag_redraw()
+        # The upload thread stops at its next read
+        if event.type == 'ESC' and sf_state.uploading:
+            sf_state.upload_cancel.set()
+            return {'RUNNING_MODAL'}
 
-                # forward message from upload thread
-                if not sf_state.report_type:
-                    sf_state.report_type = 'ERROR'
-                self.report({sf_state.report_type}, sf_state.report_message)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
 
-                wm.event_timer_remove(self._timer)
-                self._thread.join()
-                sf_state.uploading = False
+        # The file is saved on the first event, so that the panel shows the export started
+        if self._export is None and self._thread is None:
+            try:
+                self.start_export(context)
+            except Exception as e:
+                self.report({'WARNING'}, "Error occured while preparing your file: %s" % str(e))
+                self.finish(context)
                 return {'FINISHED'}
+            self.redraw(context)
+            return {'PASS_THROUGH'}
+
+        if sf_state.exporting:
+            if self._export.is_alive():
+                self.redraw(context)
+                return {'PASS_THROUGH'}
+            sf_state.exporting = False
+            if not self.start_upload(context):
+                self.finish(context)
+                return {'FINISHED'}
+            self.redraw(context)
+            return {'PASS_THROUGH'}
+
+        self.redraw(context)
+        if not self._thread.is_alive():
+            # forward message from upload thread
+            if not sf_state.report_type:
+                sf_state.report_type = 'ERROR'
+            self.report({sf_state.report_type}, sf_state.report_message)
+
+            self._thread.join()
+            self.finish(context)
+            return {'FINISHED'}
 
         return {'PASS_THROUGH'}
 
     def execute(self, context):
 
-        if sf_state.uploading:
+        if sf_state.uploading or sf_state.exporting:
             self.report({'WARNING'}, "Please wait till current upload is finished")
             return {'CANCELLED'}
 
         wm = context.window_manager
-        props = wm.icosa_export
         sf_state.model_url = ""
 
+        # Upload the package kept from a failed upload, without exporting again
+        if self.retry:
+            pending = get_pending_upload()
+            if not pending:
+                self.report({'WARNING'}, "No upload to retry")
+                return {'CANCELLED'}
+            self.begin_upload(pending['members'], pending['filename'], pending['size'])
+        else:
+            sf_state.exporting = True
+            sf_state.export_stage = "Saving file"
+
+        wm.modal_handler_add(self)
+        self._timer = wm.event_timer_add(0.5, window=context.window)
+        self.redraw(context)
+
+        return {'RUNNING_MODAL'}
+
+    def start_export(self, context):
+        global persistent_worker
+
+        props = context.window_manager.icosa_export
+
         # Prepare to save the file
-        binary_path = bpy.app.binary_path
-        script_path = os.path.dirname(os.path.realpath(__file__))
         basename, ext = os.path.splitext(bpy.data.filepath)
         if not basename:
             basename = os.path.join(basename, "temp")
         if not ext:
             ext = ".blend"
-        tempdir = tempfile.mkdtemp()
-        filepath = os.path.join(tempdir, "export-icosa" + ext)
-
-        ICOSA_EXPORT_DATA_FILE = os.path.join(tempdir, "export-icosa.json")
+        self._tempdir = tempfile.mkdtemp()
+        self._blend_path = os.path.join(self._tempdir, "export-icosa" + ext)
+
+        # save a copy of actual scene but don't interfere with the users models,
+        # uncompressed as the export and the thumbnail render both open it
+        bpy.ops.wm.save_as_mainfile(filepath=self._blend_path, compress=False, copy=True)
+
+        with open(os.path.join(self._tempdir, "export-icosa.json"), 'w') as s:
+            json.dump({
+                    "selection": props.selection,
+                    "size_limit": Config.ICOSA_UPLOAD_LIMITS['basic'] if props.fit_upload_limit else 0,
+                    "optimize_textures": props.optimize_textures,
+                    "max_texture_size": int(props.max_texture_size) if props.optimize_textures else 0,
+                    "thumbnail_mode": props.thumbnail_mode,
+                    "thumbnail_width": props.thumbnail_width,
+                    "thumbnail_height": props.thumbnail_height,
+                    "thumbnail_samples": props.thumbnail_samples,
+                    "thumbnail_frame": props.thumbnail_frame,
+                    "thumbnail_file": bpy.path.abspath(props.thumbnail_file),
+                    }, s)
+
+        use_worker = get_preference('persistentExportWorker', True)
+        if use_worker and persistent_worker is None:
+            from . import export_worker
+            persistent_worker = export_worker.ExportWorker()
+
+        sf_state.export_stage = "Starting export"
+        self._export = ExportThread(self._blend_path, self._tempdir, use_worker)
+        self._export.start()
+
+    def start_upload(self, context):
+        """Read the result of the export and start uploading it, returns False on failure"""
+        props = context.window_manager.icosa_export
+        ICOSA_EXPORT_DATA_FILE = os.path.join(self._tempdir, "export-icosa.json")
 
         try:
-            # save a copy of actual scene but don't interfere with the users models
-            bpy.ops.wm.save_as_mainfile(filepath=filepath, compress=True, copy=True)
-
-            with open(ICOSA_EXPORT_DATA_FILE, 'w') as s:
-                json.dump({
-                        "selection": props.selection,
-                        }, s)
+            if self._export.error is not None:
+                raise self._export.error
 
-            subprocess.check_call([
-                    binary_path,
-                    "--background",
-                    "-noaudio",
-                    filepath,
-                    "--python", os.path.join(script_path, "pack_for_export.py"),
-                    "--", tempdir
-                    ])
-
-            os.remove(filepath)
+            os.remove(self._blend_path)
 
             # read subprocess call results
             with open(ICOSA_EXPORT_DATA_FILE, 'r') as s:
                 r = json.load(s)
                 size = r["size"]
-                props.filepath = r["filepath"]
+                members = r["members"]
                 filename = r["filename"]
+                timings = r.get("timings", {})
+                reductions = r.get("reductions", [])
+            print("Export timings: " + ", ".join("{} {:.2f}s".format(stage, t) for stage, t in timings.items()))
+            if reductions:
+                self.report({'INFO'}, "Reduced to fit the upload limit: " + ", ".join(reductions))
 
             os.remove(ICOSA_EXPORT_DATA_FILE)
 
+            # Kept until the upload is confirmed
+            clear_pending_upload()
+            props.filepath = os.path.join(Config.ICOSA_UPLOAD_DIR, os.path.splitext(filename)[0])
+            os.makedirs(props.filepath, exist_ok=True)
+            for member in members:
+                path = os.path.join(props.filepath, os.path.basename(member['path']))
+                shutil.move(member['path'], path)
+                member['path'] = path
+
         except Exception as e:
             self.report({'WARNING'}, "Error occured while preparing your file: %s" % str(e))
-            return {'FINISHED'}
+            return False
 
         # Check the generated file size against the user plans, to know if the upload will succeed
         upload_limit = Config.ICOSA_UPLOAD_LIMITS['basic']
@@ -2257,36 +4408,56 @@ class ExportIcosa(bpy.types.Operator):
             human_size_limit    = Utils.humanify_size(upload_limit)
             human_exported_size = Utils.humanify_size(size)
             self.report({'ERROR'}, "Upload size is above your plan upload limit: %s > %s" % (human_exported_size, human_size_limit))
-            return {'FINISHED'}
+            shutil.rmtree(props.filepath)
+            return False
 
+        save_pending_upload(props.filepath, members, filename, size)
+        self.begin_upload(members, filename, size)
+        return True
+
+    def begin_upload(self, members, filename, size):
         sf_state.uploading = True
         sf_state.size_label = Utils.humanify_size(size)
+        sf_state.upload_sent = 0
+        sf_state.upload_total = size
+        sf_state.upload_attempt = 1
+        sf_state.upload_cancel.clear()
         self._thread = threading.Thread(
                 target=upload_as_multipart,
-                args=(props.filepath, filename),
+                args=(members, filename),
                 )
         self._thread.start()
 
-        wm.modal_handler_add(self)
-        self._timer = wm.event_timer_add(1.0, window=context.window)
-        
-        return {'RUNNING_MODAL'}
+    def redraw(self, context):
+        for area in context.screen.areas if context.screen else []:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        sf_state.exporting = False
+        sf_state.uploading = False
+        sf_state.export_stage = ""
+        if self._blend_path:
+            terminate(self._blend_path)
+        self.redraw(context)
 
     def cancel(self, context):
-        wm = context.window_manager
-        wm.event_timer_remove(self._timer)
-        self._thread.join()
+        if self._export is not None and self._export.is_alive():
+            self._export.cancel()
+            self._export.join()
+        if self._thread is not None:
+            sf_state.upload_cancel.set()
+            self._thread.join()
+        self.finish(context)
 
 def get_temporary_path():
 
     # Try preferences cache directory first (if available)
-    prefs = _get_addon_preferences()
-    cachePath = None
-    if prefs is not None:
-        try:
-            cachePath = getattr(prefs, 'cachePath', None)
-        except Exception:
-            cachePath = None
+    try:
+        cachePath = get_preference('cachePath', None)
+    except Exception:
+        cachePath = None
 
     if cachePath:
         return cachePath
@@ -2317,9 +4488,18 @@ def updateCacheDirectory(self, context):
     Config.ICOSA_TEMP_DIR = os.path.join(path, "icosa_downloads")
     Config.ICOSA_THUMB_DIR = os.path.join(Config.ICOSA_TEMP_DIR, 'thumbnails')
     Config.ICOSA_MODEL_DIR = os.path.join(Config.ICOSA_TEMP_DIR, 'imports')
+    Config.ICOSA_BLEND_CACHE_DIR = os.path.join(Config.ICOSA_TEMP_DIR, 'blends')
+    Config.ICOSA_PROXY_DIR = os.path.join(Config.ICOSA_TEMP_DIR, 'proxies')
+    # Packages waiting for their upload outlive the session and the cache folder
+    Config.ICOSA_UPLOAD_DIR = bpy.utils.user_resource("SCRIPTS", path=os.path.join("icosa_cache", "uploads"), create=True)
     if not os.path.exists(Config.ICOSA_TEMP_DIR): os.makedirs(Config.ICOSA_TEMP_DIR)
     if not os.path.exists(Config.ICOSA_THUMB_DIR): os.makedirs(Config.ICOSA_THUMB_DIR)
     if not os.path.exists(Config.ICOSA_MODEL_DIR): os.makedirs(Config.ICOSA_MODEL_DIR)
+    if not os.path.exists(Config.ICOSA_BLEND_CACHE_DIR): os.makedirs(Config.ICOSA_BLEND_CACHE_DIR)
+    if not os.path.exists(Config.ICOSA_PROXY_DIR): os.makedirs(Config.ICOSA_PROXY_DIR)
+    if not os.path.exists(Config.ICOSA_UPLOAD_DIR): os.makedirs(Config.ICOSA_UPLOAD_DIR)
+
+    load_pending_upload()
 
 class IcosaAddonPreferences(bpy.types.AddonPreferences):
     bl_idname = _addon_key()
@@ -2351,18 +4531,85 @@ class IcosaAddonPreferences(bpy.types.AddonPreferences):
         ),
         subtype='FILE_PATH'
     )
-    materialSuffixPattern: StringProperty(
-        name="Material suffix to remove",
+    instanceRepeatedAssets: BoolProperty(
+        name="Instance repeated imports",
         description=(
-            "Pattern to remove from material names when matching\n"
-            "Example: '.001' to match 'Material.001' with 'Material'"
+            "Importing a model already in the file adds an instance of it\n"
+            "instead of a new copy of its data"
         ),
-        default=""
+        default=True
+    )
+    importInBackground: BoolProperty(
+        name="Import in the background",
+        description=(
+            "Convert models in a background Blender process while you keep working,\n"
+            "and only append the processed result to the scene"
+        ),
+        default=False
+    )
+    useBlendCache: BoolProperty(
+        name="Cache imported models",
+        description=(
+            "Keep the processed result of each import as a .blend in the\n"
+            "download directory, and append it on later imports of the same model"
+        ),
+        default=True
+    )
+    materialLinkMode: EnumProperty(
+        name="Library materials",
+        items=(
+            ('REUSE', "Reuse", "Append each library material once and reuse it for later imports"),
+            ('LINK', "Link", "Link the materials from the library file instead of appending them"),
+            ('APPEND', "Append", "Append new copies of the library materials on every import"),
+        ),
+        description="How materials from the library are brought into the file",
+        default='REUSE'
+    )
+    deduplicateTextures: BoolProperty(
+        name="Deduplicate textures",
+        description=(
+            "Replace the images of imported models with identical images\n"
+            "already in the file, such as brush textures shared by sketches"
+        ),
+        default=True
+    )
+    persistentExportWorker: BoolProperty(
+        name="Keep an export process running",
+        description=(
+            "Export in a background Blender process kept running between uploads,\n"
+            "instead of starting a new one for every upload"
+        ),
+        default=True,
+        update=lambda self, context: stop_export_worker()
+    )
+    speculativePrefetch: BoolProperty(
+        name="Prefetch selected model",
+        description=(
+            "Start downloading the model selected in the search results\n"
+            "in the background, before Import is clicked"
+        ),
+        default=False
+    )
+    prefetchSizeLimit: IntProperty(
+        name="Prefetch size limit (MB)",
+        description="Models larger than this are only downloaded when Import is clicked",
+        default=50,
+        min=1
     )
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "cachePath", text="Download directory")
         layout.prop(self, "downloadHistory", text="Download history (.csv)")
+        layout.prop(self, "useBlendCache")
+        layout.prop(self, "instanceRepeatedAssets")
+        layout.prop(self, "importInBackground")
+        layout.prop(self, "deduplicateTextures")
+        layout.prop(self, "persistentExportWorker")
+        row = layout.row()
+        row.prop(self, "speculativePrefetch")
+        sub = row.row()
+        sub.enabled = self.speculativePrefetch
+        sub.prop(self, "prefetchSizeLimit")
         layout.separator()
         layout.label(text="Material Swapping:")
 
@@ -2383,7 +4630,7 @@ class IcosaAddonPreferences(bpy.types.AddonPreferences):
             box.label(text="No material library found", icon='ERROR')
 
         layout.prop(self, "materialLibraryPath", text="Custom library (.blend)")
-        layout.prop(self, "materialSuffixPattern", text="Suffix to remove")
+        layout.prop(self, "materialLinkMode")
 
 classes = (
     IcosaAddonPreferences,
@@ -2412,10 +4659,17 @@ classes = (
     IcosaSearchPreviousResults,
     IcosaSearchNextResults,
     ImportModalOperator,
+    BackgroundImportOperator,
+    IcosaWaitForPrefetch,
+    IcosaSwapLOD,
+    IcosaRestoreTextures,
+    IcosaUnmerge,
+    IcosaReplacePlaceholders,
     ViewOnIcosaGallery,
     IcosaDownloadModel,
     IcosaLogger,
     ExportIcosa,
+    IcosaDiscardUpload,
     )
 
 # TODO
@@ -2446,7 +4700,7 @@ def register():
     res.append(('NORESULTS', 'empty', "", icosa_icon['0'].icon_id, 0))
     preview_collection['default'] = tuple(res)
     preview_collection['icosa_icon'] = icosa_icon
-    bpy.types.WindowManager.result_previews = EnumProperty(items=list_current_results)
+    bpy.types.WindowManager.result_previews = EnumProperty(items=list_current_results, update=prefetch_selected_result)
 
     for cls in classes:
         bpy.utils.register_class(cls)
@@ -2460,6 +4714,9 @@ def register():
     updateCacheDirectory(None, context=bpy.context)
 
 def unregister():
+    cancel_prefetch()
+    stop_export_worker()
+
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
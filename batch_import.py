@@ -0,0 +1,269 @@
+"""
+Copyright 2025 Icosa Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Headless batch import of Icosa Gallery assets
+
+    blender --background --factory-startup --python batch_import.py -- \\
+        [--ids ASSET_ID ...] [--query TEXT --max-results 100 ...] \\
+        (--output DIR | --combined FILE.blend) [--workers 4]
+
+Assets are downloaded, imported, have their materials swapped from the
+library and are saved to DIR/<asset id>.blend, each holding a collection
+ready to be appended or linked. With --combined, all of them are then
+appended into a single .blend. The work is spread over a pool of
+background Blender processes.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import bpy
+
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.abspath(__file__)
+
+
+def load_addon(args):
+    """Import and register the add-on package this script belongs to"""
+    sys.path.insert(0, os.path.dirname(ADDON_DIR))
+    addon = importlib.import_module(os.path.basename(ADDON_DIR))
+
+    if args.material_library:
+        addon.preference_overrides['materialLibraryPath'] = os.path.abspath(args.material_library)
+    if args.material_link_mode:
+        addon.preference_overrides['materialLinkMode'] = args.material_link_mode
+    if args.cache_dir:
+        addon.preference_overrides['cachePath'] = os.path.abspath(args.cache_dir)
+    # Every asset goes to its own file, there is nothing to instance or cache
+    addon.preference_overrides['instanceRepeatedAssets'] = False
+    addon.preference_overrides['useBlendCache'] = False
+
+    addon.register()
+    return addon
+
+
+def get_headers(token):
+    return {'Authorization': 'Bearer ' + token} if token else {}
+
+
+def search_asset_ids(addon, args):
+    """Asset ids of the search results, following result pages up to max_results"""
+    query = addon.build_search_request(args.query, args.curated, args.include_tiltbrush,
+                                       args.face_count, args.category, args.sort_by)
+    url = addon.Config.BASE_SEARCH + query
+    asset_ids = []
+    while url and len(asset_ids) < args.max_results:
+        r = addon.requests_get(url, headers=get_headers(args.token))
+        r.raise_for_status()
+        json_data = r.json()
+        asset_ids.extend(asset['assetId'] for asset in json_data.get('assets', []))
+
+        next_page = json_data.get('nextPageToken')
+        url = "{}{}&pageToken={}".format(addon.Config.BASE_SEARCH, query, next_page) if next_page else None
+    return asset_ids[:args.max_results]
+
+
+def import_asset(addon, asset, token, fake_user):
+    """
+    Download, import and save a single asset to its own .blend
+
+    Args:
+        asset: Job entry with the asset id and output path, and optionally
+            its title and urls to skip the request for the model info
+    """
+    asset_id = asset['asset_id']
+    if asset.get('main_url'):
+        title = asset.get('title') or asset_id
+        main_url, additional_urls = asset['main_url'], asset.get('additional_urls', [])
+        info = {}
+    else:
+        r = addon.requests_get("{}/{}".format(addon.Config.ICOSA_MODEL, asset_id), headers=get_headers(token))
+        r.raise_for_status()
+        model = addon.IcosaModel(r.json())
+        title = model.title
+        main_url, additional_urls = model.get_urls()
+        info = {'icosa_title': model.title, 'icosa_author': model.author, 'icosa_license': str(model.license)}
+
+    model_path = addon.find_model_file(addon.fetch_model_files(main_url, additional_urls, asset_id))
+    if not model_path:
+        raise RuntimeError("Failed to download model")
+
+    collection = addon.import_model_file(bpy.context, model_path, asset_id, title)
+    for key, value in info.items():
+        collection[key] = value
+    bpy.data.libraries.write(asset['output'], {collection}, path_remap='ABSOLUTE', fake_user=fake_user)
+
+    # Keep the memory flat across assets
+    removed = [collection] + list(collection.children_recursive) + list(collection.all_objects)
+    bpy.data.batch_remove(removed)
+    bpy.data.orphans_purge(do_recursive=True)
+
+
+def run_worker(args):
+    addon = load_addon(args)
+    with open(args.worker_job, 'r') as f:
+        job = json.load(f)
+
+    results = {}
+    for asset in job['assets']:
+        asset_id = asset['asset_id']
+        start = time.time()
+        try:
+            if os.path.exists(asset['output']) and not job.get('overwrite'):
+                print("Skipping {}, already imported".format(asset_id))
+            else:
+                import_asset(addon, asset, job.get('token', ''), job.get('fake_user', True))
+            results[asset_id] = {'path': asset['output'], 'time': time.time() - start}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            results[asset_id] = {'error': str(e)}
+        print("ICOSA_BATCH {} {}".format(asset_id, 'failed' if 'error' in results[asset_id] else 'done'))
+
+    with open(job['result'], 'w') as f:
+        json.dump(results, f)
+
+
+def worker_command(job_path, material_library=None, material_link_mode=None, cache_dir=None):
+    """Command line of a background Blender worker processing a job file"""
+    command = [
+        bpy.app.binary_path,
+        "--background",
+        "--factory-startup",
+        "-noaudio",
+        "--python", SCRIPT_PATH,
+        "--", "--worker-job", job_path,
+    ]
+    if material_library:
+        command += ["--material-library", material_library]
+    if material_link_mode:
+        command += ["--material-link-mode", material_link_mode]
+    if cache_dir:
+        command += ["--cache-dir", cache_dir]
+    return command
+
+
+def start_workers(args, asset_ids, output_dir, job_dir):
+    """Spread the assets over a pool of background Blender processes"""
+    worker_count = max(1, min(args.workers, len(asset_ids)))
+    workers = []
+    for i in range(worker_count):
+        job_path = os.path.join(job_dir, 'job-{}.json'.format(i))
+        job = {
+            'assets': [
+                {'asset_id': asset_id, 'output': os.path.join(output_dir, '{}.blend'.format(asset_id))}
+                for asset_id in asset_ids[i::worker_count]
+            ],
+            'overwrite': args.overwrite,
+            'token': args.token,
+            'result': os.path.join(job_dir, 'result-{}.json'.format(i)),
+        }
+        with open(job_path, 'w') as f:
+            json.dump(job, f)
+
+        command = worker_command(job_path, args.material_library, args.material_link_mode, args.cache_dir)
+        workers.append((subprocess.Popen(command), job['result']))
+    return workers
+
+
+def combine(addon, results, combined_path):
+    """Append all the imported assets into a single .blend"""
+    for asset_id, result in results.items():
+        if 'path' in result and addon.append_cached_asset(bpy.context, result['path'], asset_id) is None:
+            print("No collection found for {} in {}".format(asset_id, result['path']))
+    bpy.ops.wm.save_as_mainfile(filepath=combined_path)
+
+
+def run(args):
+    addon = load_addon(args)
+
+    asset_ids = list(args.ids)
+    if args.query is not None:
+        asset_ids += search_asset_ids(addon, args)
+    asset_ids = list(dict.fromkeys(asset_ids))
+    if not asset_ids:
+        print("No assets to import")
+        return 1
+
+    job_dir = tempfile.mkdtemp()
+    output_dir = os.path.abspath(args.output or os.path.join(job_dir, 'assets'))
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = time.time()
+    results = {}
+    for process, result_path in start_workers(args, asset_ids, output_dir, job_dir):
+        process.wait()
+        if os.path.exists(result_path):
+            with open(result_path, 'r') as f:
+                results.update(json.load(f))
+
+    failed = [asset_id for asset_id in asset_ids if 'path' not in results.get(asset_id, {})]
+    print("----------------------------------")
+    print("Imported {} of {} assets in {:.1f}s".format(len(asset_ids) - len(failed), len(asset_ids), time.time() - start))
+    for asset_id in failed:
+        print("Failed: {} {}".format(asset_id, results.get(asset_id, {}).get('error', 'worker crashed')))
+    print("----------------------------------")
+
+    if args.combined:
+        combine(addon, results, os.path.abspath(args.combined))
+    return 1 if failed else 0
+
+
+def parse_args():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog="batch_import.py", description="Batch import Icosa Gallery assets")
+    parser.add_argument("--ids", nargs="*", default=[], help="Asset ids to import")
+    parser.add_argument("--query", help="Import the results of this search (may be empty)")
+    parser.add_argument("--category", default="ALL")
+    parser.add_argument("--face-count", default="ANY")
+    parser.add_argument("--sort-by", default="BEST")
+    parser.add_argument("--curated", action="store_true")
+    parser.add_argument("--include-tiltbrush", action="store_true")
+    parser.add_argument("--max-results", type=int, default=100)
+    parser.add_argument("--output", help="Directory receiving one .blend per asset")
+    parser.add_argument("--combined", help="Also append every asset into this .blend")
+    parser.add_argument("--overwrite", action="store_true", help="Import again assets already in the output directory")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--token", default="", help="Icosa Gallery access token")
+    parser.add_argument("--material-library", help="Material library .blend")
+    parser.add_argument("--material-link-mode", choices=("REUSE", "LINK", "APPEND"))
+    parser.add_argument("--cache-dir", help="Download directory")
+    parser.add_argument("--worker-job", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if not args.worker_job and not (args.output or args.combined):
+        parser.error("one of --output or --combined is required")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        if args.worker_job:
+            run_worker(args)
+        else:
+            sys.exit(run(args))
+    except SystemExit:
+        raise
+    except:
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,199 @@
+"""
+Copyright 2025 Icosa Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Long-lived background Blender process running export jobs
+
+    blender --background -noaudio --python export_worker.py
+
+The worker listens on a local port, authenticated with the key given in
+the ICOSA_WORKER_AUTHKEY environment variable, and prints its address on
+stdout. Each job opens a saved copy of the file to export and runs
+pack_for_export on it, so that Blender start-up and add-on registration
+are only paid once.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+import bpy
+
+SCRIPT_PATH = os.path.abspath(__file__)
+AUTHKEY_VARIABLE = "ICOSA_WORKER_AUTHKEY"
+ADDRESS_PREFIX = "ICOSA_WORKER_ADDRESS"
+# See pack_for_export.report_progress
+PROGRESS_PREFIX = "ICOSA_PROGRESS"
+# See pack_for_export.report_child
+CHILD_PREFIX = "ICOSA_CHILD"
+
+# Seconds to wait for a worker to start listening
+START_TIMEOUT = 60
+
+
+class WorkerError(Exception):
+    """The worker couldn't be started or died during a job"""
+
+
+def track_child(line, children):
+    """Update the pids of the processes started by an export from one of its CHILD_PREFIX lines"""
+    event, pid = line[len(CHILD_PREFIX):].split()[:2]
+    if event == 'start':
+        children.add(int(pid))
+    else:
+        children.discard(int(pid))
+
+
+def kill_children(children):
+    """Kill the processes started by an export, which outlive it otherwise"""
+    for pid in list(children):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    children.clear()
+
+
+def serve():
+    """Run export jobs sent by the add-on until it disconnects"""
+    sys.path.append(os.path.dirname(SCRIPT_PATH))
+    import pack_for_export
+
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_VARIABLE))
+    with Listener(('127.0.0.1', 0), authkey=authkey) as listener:
+        print("{} {} {}".format(ADDRESS_PREFIX, *listener.address), flush=True)
+        with listener.accept() as connection:
+            while True:
+                try:
+                    job = connection.recv()
+                except EOFError:
+                    return
+
+                try:
+                    bpy.ops.wm.open_mainfile(filepath=job['blend'], load_ui=False)
+                    pack_for_export.run_export(job['tempdir'])
+                    reply = {'ok': True}
+                except Exception:
+                    import traceback
+                    traceback.print_exc()
+                    reply = {'ok': False, 'error': traceback.format_exc()}
+
+                # Don't keep the exported scene in memory between jobs
+                bpy.ops.wm.read_homefile(use_empty=True)
+                connection.send(reply)
+
+
+class ExportWorker:
+    """Add-on side of the worker: starts it on the first job, and sends it jobs"""
+
+    def __init__(self):
+        self.process = None
+        self.connection = None
+        self.lock = threading.Lock()
+        # Called with the stages reported by the current job
+        self.on_progress = None
+        # Processes started by the current job
+        self.children = set()
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        authkey = os.urandom(32)
+        env = dict(os.environ)
+        env[AUTHKEY_VARIABLE] = authkey.hex()
+        self.process = subprocess.Popen(
+            [bpy.app.binary_path, "--background", "-noaudio", "--python", SCRIPT_PATH],
+            env=env, stdout=subprocess.PIPE, text=True, bufsize=1)
+
+        address = []
+        started = threading.Event()
+
+        def read_output():
+            # Forward the output of the worker, which must also be drained
+            for line in self.process.stdout:
+                if line.startswith(ADDRESS_PREFIX) and not started.is_set():
+                    host, port = line.split()[1:3]
+                    address.append((host, int(port)))
+                    started.set()
+                elif line.startswith(CHILD_PREFIX):
+                    track_child(line, self.children)
+                elif line.startswith(PROGRESS_PREFIX):
+                    on_progress = self.on_progress
+                    if on_progress is not None:
+                        on_progress(line[len(PROGRESS_PREFIX):].strip())
+                else:
+                    print(line, end='')
+            started.set()
+
+        threading.Thread(target=read_output, daemon=True).start()
+        if not started.wait(START_TIMEOUT) or not address:
+            self.stop()
+            raise WorkerError("Export worker failed to start")
+        try:
+            self.connection = Client(address[0], authkey=authkey)
+        except OSError as e:
+            self.stop()
+            raise WorkerError("Failed to connect to the export worker: {}".format(e))
+
+    def export(self, blend_path, tempdir, on_progress=None):
+        """
+        Export a saved .blend with pack_for_export, the settings and result
+        going through the JSON file of the temporary directory. on_progress
+        is called from another thread with the stages of the export
+
+        Raises:
+            WorkerError: if the worker died, the job can be run by another process
+            RuntimeError: if the export itself failed
+        """
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+            self.on_progress = on_progress
+            try:
+                self.connection.send({'blend': blend_path, 'tempdir': tempdir})
+                reply = self.connection.recv()
+            except (AttributeError, EOFError, OSError) as e:
+                # Also raised when stopped from another thread, the connection being gone
+                self.stop()
+                raise WorkerError("Export worker died: {}".format(e))
+            finally:
+                self.on_progress = None
+
+        if not reply['ok']:
+            raise RuntimeError(reply['error'])
+
+    def stop(self):
+        """Kill the worker, interrupting its current job"""
+        process, self.process = self.process, None
+        if process is not None:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+        kill_children(self.children)
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+
+if __name__ == "__main__":
+    try:
+        serve()
+    except:
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
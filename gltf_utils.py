@@ -0,0 +1,419 @@
+"""
+Copyright 2025 Icosa Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Helpers reading and patching .gltf/.glb files without Blender
+"""
+
+import base64
+import json
+import mmap
+import os
+import shutil
+import struct
+import urllib.parse
+
+GLB_MAGIC = 0x46546C67  # b'glTF'
+GLB_CHUNK_JSON = 0x4E4F534A  # b'JSON'
+GLB_CHUNK_BIN = 0x004E4942  # b'BIN\0'
+GLB_HEADER = struct.Struct('<III')
+GLB_CHUNK_HEADER = struct.Struct('<II')
+
+
+def is_glb(path):
+    with open(path, 'rb') as f:
+        header = f.read(4)
+    return len(header) == 4 and struct.unpack('<I', header)[0] == GLB_MAGIC
+
+
+def read_glb_json_chunk(f):
+    """
+    Read the JSON chunk of an opened .glb file
+
+    Returns:
+        (json bytes, offset of the chunk following the JSON chunk, total length)
+    """
+    magic, version, length = GLB_HEADER.unpack(f.read(GLB_HEADER.size))
+    if magic != GLB_MAGIC:
+        raise ValueError("Not a binary glTF file")
+    chunk_length, chunk_type = GLB_CHUNK_HEADER.unpack(f.read(GLB_CHUNK_HEADER.size))
+    if chunk_type != GLB_CHUNK_JSON:
+        raise ValueError("First glTF chunk is not JSON")
+    json_bytes = f.read(chunk_length)
+    return json_bytes, GLB_HEADER.size + GLB_CHUNK_HEADER.size + chunk_length, length
+
+
+def read_json(path):
+    """Parse the JSON of a .gltf file, or only the JSON chunk of a .glb file"""
+    with open(path, 'rb') as f:
+        if is_glb(path):
+            json_bytes, _, _ = read_glb_json_chunk(f)
+        else:
+            json_bytes = f.read()
+    return json.loads(json_bytes.decode('utf-8'))
+
+
+def dump_json(gltf):
+    return json.dumps(gltf, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def write_json(path, gltf):
+    """
+    Write the JSON back compactly. For a .glb, the JSON chunk is rebuilt with
+    its 4-byte space padding and the binary chunk is copied over untouched
+    """
+    json_bytes = dump_json(gltf)
+    temp_path = path + '.tmp'
+
+    if not is_glb(path):
+        with open(temp_path, 'wb') as f:
+            f.write(json_bytes)
+        os.replace(temp_path, path)
+        return
+
+    json_bytes += b' ' * (-len(json_bytes) % 4)
+    with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+        _, rest_offset, length = read_glb_json_chunk(src)
+        rest_length = length - rest_offset
+        total_length = GLB_HEADER.size + GLB_CHUNK_HEADER.size + len(json_bytes) + rest_length
+
+        dst.write(GLB_HEADER.pack(GLB_MAGIC, 2, total_length))
+        dst.write(GLB_CHUNK_HEADER.pack(len(json_bytes), GLB_CHUNK_JSON))
+        dst.write(json_bytes)
+        src.seek(rest_offset)
+        shutil.copyfileobj(src, dst)
+    os.replace(temp_path, path)
+
+
+def patch_tilt_brush_uvs(path):
+    """
+    Blender doesn't support uv channels with 3 or 4 components
+    Legacy Tilt files from Poly are using 3 or 4 components for uv channels
+    If we prepend "_" to those channels, Blender will treat them as custom channels
+
+    Returns:
+        True if the file was modified
+    """
+    gltf = read_json(path)
+
+    is_tilt = "GOOGLE_tilt_brush_techniques" in gltf.get("extensions", {}) or \
+        "GOOGLE_tilt_brush_techniques" in gltf.get("extensionsUsed", [])
+    if not is_tilt:
+        return False
+
+    accessors = gltf.get("accessors", [])
+    changed = False
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh.get("primitives", []):
+            attributes = primitive.get("attributes", {})
+            for name in ("TEXCOORD_0", "TEXCOORD_1"):
+                if name not in attributes:
+                    continue
+                try:
+                    accessor_type = accessors[attributes[name]].get("type")
+                except (IndexError, KeyError, TypeError):
+                    accessor_type = None
+                # 2 component channels are already supported
+                if accessor_type == "VEC2":
+                    continue
+                attributes["_" + name] = attributes.pop(name)
+                changed = True
+
+    if changed:
+        write_json(path, gltf)
+    return changed
+
+
+COMPONENT_SIZES = {5120: 1, 5121: 1, 5122: 2, 5123: 2, 5125: 4, 5126: 4}
+TYPE_COMPONENTS = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def read_image_size(data):
+    """Width and height read from the header of PNG or JPEG data, or None"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        return struct.unpack('>II', data[16:24])
+
+    if data[:2] == b'\xff\xd8':
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker in JPEG_SOF_MARKERS:
+                height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def read_image_alpha(data):
+    """
+    Whether the PNG or JPEG data has an alpha channel, read from its header,
+    or None for other formats. The pixels may still all be opaque
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        color_type = data[25]
+        if color_type in (4, 6):
+            return True
+        # Grey, RGB and palette images have transparency in a tRNS chunk
+        i = 8
+        while i + 8 <= len(data):
+            length, chunk_type = struct.unpack('>I4s', data[i:i + 8])
+            if chunk_type == b'tRNS':
+                return True
+            if chunk_type == b'IDAT':
+                return False
+            i += 12 + length
+        return False
+
+    if data[:2] == b'\xff\xd8':
+        return False
+    return None
+
+
+class ModelFile:
+    """
+    A .gltf or .glb file opened for inspection. The .glb and external
+    buffers are memory-mapped, so that only the bytes actually read,
+    such as image headers, are loaded
+    """
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(path)
+        self.maps = []
+        self.bin_chunk = None
+
+        if is_glb(path):
+            with open(path, 'rb') as f:
+                json_bytes, rest_offset, length = read_glb_json_chunk(f)
+            data = self.map_file(path)
+            if rest_offset + GLB_CHUNK_HEADER.size <= length:
+                chunk_length, chunk_type = GLB_CHUNK_HEADER.unpack(data[rest_offset:rest_offset + GLB_CHUNK_HEADER.size])
+                if chunk_type == GLB_CHUNK_BIN:
+                    start = rest_offset + GLB_CHUNK_HEADER.size
+                    self.bin_chunk = data[start:start + chunk_length]
+        else:
+            with open(path, 'rb') as f:
+                json_bytes = f.read()
+        self.gltf = json.loads(json_bytes.decode('utf-8'))
+        self.buffers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.bin_chunk = None
+        self.buffers = {}
+        for data, mapped in self.maps:
+            try:
+                data.release()
+                mapped.close()
+            except BufferError:
+                # Still referenced by a slice, closed once collected
+                pass
+        self.maps = []
+
+    def map_file(self, path):
+        """Memory-mapped contents of a file, or None if it is missing or empty"""
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = memoryview(mapped)
+        self.maps.append((data, mapped))
+        return data
+
+    def read_uri(self, uri):
+        if uri.startswith('data:'):
+            return memoryview(base64.b64decode(uri.split(',', 1)[1]))
+        return self.map_file(os.path.join(self.directory, urllib.parse.unquote(uri)))
+
+    def buffer(self, index):
+        if index not in self.buffers:
+            uri = self.gltf.get('buffers', [])[index].get('uri')
+            self.buffers[index] = self.read_uri(uri) if uri else self.bin_chunk
+        return self.buffers[index]
+
+    def buffer_view(self, index):
+        view = self.gltf.get('bufferViews', [])[index]
+        data = self.buffer(view['buffer'])
+        if data is None:
+            return None
+        offset = view.get('byteOffset', 0)
+        return data[offset:offset + view['byteLength']]
+
+    def image_data(self, image):
+        if 'bufferView' in image:
+            return self.buffer_view(image['bufferView'])
+        if 'uri' in image:
+            return self.read_uri(image['uri'])
+        return None
+
+
+def inspect_model(path):
+    """
+    Estimate what importing a .gltf/.glb would cost, from its JSON and the
+    headers of its images, without decoding any mesh or image data
+
+    Returns:
+        Dict with the triangle and vertex counts, the name and size of each
+        image (None if unknown), the material names and an estimate of the
+        GPU memory used by the geometry and textures, in bytes
+    """
+    with ModelFile(path) as model:
+        gltf = model.gltf
+        accessors = gltf.get('accessors', [])
+
+        # Meshes are counted once per node using them
+        mesh_uses = {}
+        for node in gltf.get('nodes', []):
+            if 'mesh' in node:
+                mesh_uses[node['mesh']] = mesh_uses.get(node['mesh'], 0) + 1
+
+        triangles = 0
+        vertices = 0
+        geometry_accessors = set()
+        for mesh_index, mesh in enumerate(gltf.get('meshes', [])):
+            uses = mesh_uses.get(mesh_index, 1)
+            for primitive in mesh.get('primitives', []):
+                attributes = primitive.get('attributes', {})
+                geometry_accessors.update(attributes.values())
+                vertex_count = accessors[attributes['POSITION']]['count'] if 'POSITION' in attributes else 0
+                if 'indices' in primitive:
+                    geometry_accessors.add(primitive['indices'])
+                    index_count = accessors[primitive['indices']]['count']
+                else:
+                    index_count = vertex_count
+
+                mode = primitive.get('mode', 4)
+                if mode == 4:
+                    primitive_triangles = index_count // 3
+                elif mode in (5, 6):
+                    primitive_triangles = max(index_count - 2, 0)
+                else:
+                    primitive_triangles = 0
+                triangles += primitive_triangles * uses
+                vertices += vertex_count * uses
+
+        geometry_memory = 0
+        for index in geometry_accessors:
+            accessor = accessors[index]
+            geometry_memory += accessor['count'] * TYPE_COMPONENTS.get(accessor.get('type'), 1) \
+                * COMPONENT_SIZES.get(accessor.get('componentType'), 4)
+
+        textures = []
+        texture_memory = 0
+        for index, image in enumerate(gltf.get('images', [])):
+            uri = image.get('uri', '')
+            name = image.get('name') or ('' if uri.startswith('data:') else os.path.basename(uri))
+            try:
+                data = model.image_data(image)
+                size = read_image_size(data) if data is not None else None
+                del data
+            except (IndexError, KeyError, ValueError, struct.error):
+                size = None
+            textures.append((name or 'Image {}'.format(index), size))
+            if size:
+                # RGBA8 with mipmaps
+                texture_memory += size[0] * size[1] * 4 * 4 // 3
+
+    return {
+        'triangles': triangles,
+        'vertices': vertices,
+        'textures': textures,
+        'materials': [material.get('name', '') for material in gltf.get('materials', [])],
+        'gpu_memory': geometry_memory + texture_memory,
+    }
+
+
+def matrix_multiply(a, b):
+    return [[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)]
+
+
+def node_matrix(node):
+    """Local transform of a node as a row-major 4x4 matrix"""
+    if 'matrix' in node:
+        m = node['matrix']
+        # Stored in column-major order
+        return [[m[col * 4 + row] for col in range(4)] for row in range(4)]
+
+    tx, ty, tz = node.get('translation', (0.0, 0.0, 0.0))
+    x, y, z, w = node.get('rotation', (0.0, 0.0, 0.0, 1.0))
+    sx, sy, sz = node.get('scale', (1.0, 1.0, 1.0))
+    return [
+        [(1 - 2 * (y * y + z * z)) * sx, 2 * (x * y - z * w) * sy, 2 * (x * z + y * w) * sz, tx],
+        [2 * (x * y + z * w) * sx, (1 - 2 * (x * x + z * z)) * sy, 2 * (y * z - x * w) * sz, ty],
+        [2 * (x * z - y * w) * sx, 2 * (y * z + x * w) * sy, (1 - 2 * (x * x + y * y)) * sz, tz],
+        [0.0, 0.0, 0.0, 1.0],
+    ]
+
+
+def model_bounds(path):
+    """Bounds of the scene of a .gltf/.glb file, see scene_bounds"""
+    return scene_bounds(read_json(path))
+
+
+def scene_bounds(gltf):
+    """
+    Axis-aligned bounds of the meshes of a parsed glTF scene, in glTF space
+    (Y up), computed from the min/max of the position accessors through the
+    node transforms, without reading any vertex
+
+    Returns:
+        (min, max) corners, or None if the scene has no bounded mesh
+    """
+    nodes = gltf.get('nodes', [])
+    meshes = gltf.get('meshes', [])
+    accessors = gltf.get('accessors', [])
+
+    scenes = gltf.get('scenes', [])
+    if scenes:
+        roots = scenes[gltf.get('scene', 0)].get('nodes', [])
+    else:
+        children = {child for node in nodes for child in node.get('children', [])}
+        roots = [i for i in range(len(nodes)) if i not in children]
+
+    identity = [[float(i == j) for j in range(4)] for i in range(4)]
+    bounds_min = [float('inf')] * 3
+    bounds_max = [float('-inf')] * 3
+    stack = [(root, identity) for root in roots]
+    while stack:
+        node_index, parent_matrix = stack.pop()
+        node = nodes[node_index]
+        matrix = matrix_multiply(parent_matrix, node_matrix(node))
+        stack.extend((child, matrix) for child in node.get('children', []))
+
+        if 'mesh' not in node:
+            continue
+        for primitive in meshes[node['mesh']].get('primitives', []):
+            position = primitive.get('attributes', {}).get('POSITION')
+            if position is None or 'min' not in accessors[position] or 'max' not in accessors[position]:
+                continue
+            low, high = accessors[position]['min'], accessors[position]['max']
+            for corner in ((x, y, z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])):
+                for i in range(3):
+                    value = sum(matrix[i][k] * corner[k] for k in range(3)) + matrix[i][3]
+                    bounds_min[i] = min(bounds_min[i], value)
+                    bounds_max[i] = max(bounds_max[i], value)
+
+    if bounds_min[0] == float('inf'):
+        return None
+    return bounds_min, bounds_max
@@ -0,0 +1,120 @@
+"""
+Copyright 2025 Icosa Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Helpers resizing and converting image files with imbuf, which works on files only and
+doesn't touch bpy data, so it can be used outside of the main thread
+"""
+
+import os
+
+import imbuf
+
+
+def fit_size(size, max_size):
+    """Size scaled down to fit in max_size, keeping the aspect ratio"""
+    width, height = size
+    scale = max_size / max(width, height)
+    if scale >= 1.0:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def resize_image_file(src_path, dst_path, max_size):
+    """
+    Write a copy of an image scaled down to fit in max_size
+
+    Returns:
+        Size of the written image, or None if the image already fits
+    """
+    image = imbuf.load(src_path)
+    try:
+        size = fit_size(image.size, max_size)
+        if size == tuple(image.size):
+            return None
+        image.resize(size, method='BILINEAR')
+        temp_path = '{}.tmp{}'.format(*os.path.splitext(dst_path))
+        imbuf.write(image, filepath=temp_path)
+        os.replace(temp_path, dst_path)
+        return size
+    finally:
+        image.free()
+
+
+def convert_image_file(src_path, dst_path, max_size, file_type):
+    """
+    Write a copy of an image in another format, scaled down to fit in
+    max_size unless it is 0
+
+    Returns:
+        Size of the written image
+    """
+    image = imbuf.load(src_path)
+    try:
+        size = fit_size(image.size, max_size) if max_size else tuple(image.size)
+        if size != tuple(image.size):
+            image.resize(size, method='BILINEAR')
+        image.file_type = file_type
+        temp_path = '{}.tmp{}'.format(*os.path.splitext(dst_path))
+        imbuf.write(image, filepath=temp_path)
+        os.replace(temp_path, dst_path)
+        return size
+    finally:
+        image.free()
+
+
+def run_image_jobs(function, jobs):
+    """
+    Call function on each job in turn. imbuf holds the GIL while decoding
+    and encoding, so threads wouldn't run the jobs any faster
+
+    Returns:
+        Dict destination path (second item of the job) -> result of the
+        function, or the exception raised for it
+    """
+    results = {}
+    for job in jobs:
+        try:
+            results[job[1]] = function(*job)
+        except Exception as e:
+            results[job[1]] = e
+    return results
+
+
+def resize_image_files(jobs, max_size):
+    """
+    Resize image files, see run_image_jobs
+
+    Args:
+        jobs: List of (source path, destination path)
+
+    Returns:
+        Dict destination path -> result of resize_image_file, or the
+        exception raised for it
+    """
+    return run_image_jobs(lambda src, dst: resize_image_file(src, dst, max_size), jobs)
+
+
+def convert_image_files(jobs, max_size):
+    """
+    Convert image files, see run_image_jobs
+
+    Args:
+        jobs: List of (source path, destination path, imbuf file type)
+
+    Returns:
+        Dict destination path -> result of convert_image_file, or the
+        exception raised for it
+    """
+    return run_image_jobs(lambda src, dst, file_type: convert_image_file(src, dst, max_size, file_type), jobs)
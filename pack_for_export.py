@@ -20,16 +20,98 @@ This file has been modified from its original version.
 import os
 import bpy
 import json
+import subprocess
 import sys
-import zipfile
+import time
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-ICOSA_EXPORT_TEMP_DIR = sys.argv[7]
-ICOSA_EXPORT_DATA_FILE = os.path.join(ICOSA_EXPORT_TEMP_DIR, "export-icosa.json")
+import gltf_utils
+import image_utils
+import zip_stream
+
+ICOSA_EXPORT_DATA_FILENAME = "export-icosa.json"
+# Prefix of the stdout lines reporting the export stage to the add-on
+ICOSA_PROGRESS_PREFIX = "ICOSA_PROGRESS"
+# Prefix of the stdout lines reporting the processes started by the export,
+# which the add-on kills with it when the export is cancelled
+ICOSA_CHILD_PREFIX = "ICOSA_CHILD"
+
+def report_progress(stage):
+    print("{} {}".format(ICOSA_PROGRESS_PREFIX, stage), flush=True)
+
+def report_child(event, process):
+    print("{} {} {}".format(ICOSA_CHILD_PREFIX, event, process.pid), flush=True)
+
+# Reductions tried in turn until the export fits in the upload limit,
+# each one keeping those of the previous level
+SIZE_REDUCTIONS = (
+    {},
+    {'draco': True},
+    {'draco': True, 'texture_size': 2048},
+    {'draco': True, 'texture_size': 2048, 'jpeg': True},
+    {'draco': True, 'texture_size': 1024, 'jpeg': True},
+)
+# Part of the upload limit left for the thumbnail, rendered with the GLB
+THUMBNAIL_ALLOWANCE = 4 * 1024 * 1024
+# Rough ratios used to estimate the size of the GLB
+DRACO_RATIO = 0.15
+JPEG_RATIO = 0.25
+# Enough of an image file to read its size and alpha channel
+IMAGE_HEADER_SIZE = 256 * 1024
+# Images with an alpha channel are only checked for transparent pixels,
+# which means reading them all, when they are at most this large
+ALPHA_CHECK_MAX_SIZE = 2048
+
+# Add a temporary camera framing the visible meshes from a 3/4 view
+def add_framing_camera(scene):
+    import math
+    from mathutils import Vector
+
+    coords = []
+    for ob in scene.objects:
+        if ob.type == 'MESH' and ob.visible_get():
+            coords.extend(co for corner in ob.bound_box for co in ob.matrix_world @ Vector(corner))
+    if not coords:
+        return None
+
+    camera_data = bpy.data.cameras.new("Icosa thumbnail")
+    camera = bpy.data.objects.new("Icosa thumbnail", camera_data)
+    scene.collection.objects.link(camera)
+    camera.rotation_euler = (math.radians(65), 0.0, math.radians(35))
+    bpy.context.view_layer.update()
+
+    # Fit with a narrower angle than rendered, to leave a margin
+    angle = camera_data.angle
+    camera_data.angle = angle * 0.85
+    location, ortho_scale = camera.camera_fit_coords(bpy.context.evaluated_depsgraph_get(), coords)
+    camera_data.angle = angle
+    camera.location = location
+    camera_data.clip_end = max(camera_data.clip_end, (location - Vector(coords[:3])).length * 4)
+    return camera
+
+def set_eevee_engine(scene):
+    # EEVEE Next is a different engine in some Blender versions
+    try:
+        scene.render.engine = 'BLENDER_EEVEE_NEXT'
+    except TypeError:
+        scene.render.engine = 'BLENDER_EEVEE'
 
 # Render a thumbnail of the scene
-def render_thumbnail(export_settings):
+def render_thumbnail(export_settings, tempdir):
+    import shutil
+
+    mode = export_settings.get('thumbnail_mode', 'SCENE')
+
+    # Use the image given by the user as is
+    if mode == 'FILE':
+        source = export_settings.get('thumbnail_file', '')
+        if not os.path.isfile(source):
+            print("Thumbnail image not found: {}".format(source))
+            return None
+        thumbnail_path = os.path.join(tempdir, "thumbnail" + os.path.splitext(source)[1].lower())
+        shutil.copyfile(source, thumbnail_path)
+        return thumbnail_path
+
     scene = bpy.context.scene
 
     # Store original render settings
@@ -38,38 +120,72 @@ def render_thumbnail(export_settings):
     original_resolution_percentage = scene.render.resolution_percentage
     original_file_format = scene.render.image_settings.file_format
     original_filepath = scene.render.filepath
+    original_engine = scene.render.engine
+    original_camera = scene.camera
 
     # Set render settings for thumbnail
-    scene.render.resolution_x = 1920
-    scene.render.resolution_y = 1080
+    scene.render.resolution_x = export_settings.get('thumbnail_width', 1920)
+    scene.render.resolution_y = export_settings.get('thumbnail_height', 1080)
     scene.render.resolution_percentage = 100
     scene.render.image_settings.file_format = 'PNG'
 
-    thumbnail_path = os.path.join(ICOSA_EXPORT_TEMP_DIR, "thumbnail.png")
+    if mode == 'WORKBENCH':
+        scene.render.engine = 'BLENDER_WORKBENCH'
+        scene.display.shading.light = 'STUDIO'
+        scene.display.shading.color_type = 'TEXTURE'
+    elif mode == 'EEVEE':
+        set_eevee_engine(scene)
+        scene.eevee.taa_render_samples = export_settings.get('thumbnail_samples', 16)
+
+    camera = None
+    if export_settings.get('thumbnail_frame', False) or scene.camera is None:
+        camera = add_framing_camera(scene)
+        if camera is not None:
+            scene.camera = camera
+
+    thumbnail_path = os.path.join(tempdir, "thumbnail.png")
     scene.render.filepath = thumbnail_path
 
     # Render the current scene
-    bpy.ops.render.render(write_still=True)
-
-    # Restore original render settings
-    scene.render.resolution_x = original_resolution_x
-    scene.render.resolution_y = original_resolution_y
-    scene.render.resolution_percentage = original_resolution_percentage
-    scene.render.image_settings.file_format = original_file_format
-    scene.render.filepath = original_filepath
+    try:
+        bpy.ops.render.render(write_still=True)
+    finally:
+        # Restore original render settings
+        scene.render.resolution_x = original_resolution_x
+        scene.render.resolution_y = original_resolution_y
+        scene.render.resolution_percentage = original_resolution_percentage
+        scene.render.image_settings.file_format = original_file_format
+        scene.render.filepath = original_filepath
+        scene.render.engine = original_engine
+        scene.camera = original_camera
+        if camera is not None:
+            camera_data = camera.data
+            bpy.data.objects.remove(camera)
+            bpy.data.cameras.remove(camera_data)
 
     return thumbnail_path
 
-# save a copy of the current blendfile
-def save_glb(export_settings):
-    import time
-
-    filepath = ICOSA_EXPORT_TEMP_DIR
+# render the thumbnail in another Blender process, which opens the file being exported
+# and prepares its scene the same way instead of waiting for a copy to be saved
+def start_thumbnail_process(tempdir):
+    process = subprocess.Popen([
+            bpy.app.binary_path,
+            "--background",
+            "-noaudio",
+            bpy.data.filepath,
+            "--python", os.path.abspath(__file__),
+            "--", tempdir, "--thumbnail"
+            ])
+    report_child('start', process)
+    return process
+
+def export_glb(export_settings, tempdir, reductions=None):
+    if reductions is None:
+        reductions = {}
     filename = time.strftime("Icosa_%Y_%m_%d_%H_%M_%S.glb",
                              time.localtime(time.time()))
-    filepath = os.path.join(filepath, filename)
-    
-    # Export as GLB
+    filepath = os.path.join(tempdir, filename)
+
     bpy.ops.export_scene.gltf(
         filepath=filepath,
         export_format='GLB',
@@ -78,28 +194,307 @@ def save_glb(export_settings):
         use_selection=bool(export_settings['selection']),
         export_materials='EXPORT',
         export_extras=True,
-        export_apply=True  # Apply modifiers
+        export_apply=True,  # Apply modifiers
+        export_draco_mesh_compression_enable=reductions.get('draco', False),
     )
+    return filepath, filename
 
-    # Render thumbnail
-    thumbnail_path = render_thumbnail(export_settings)
+# images used by the materials of the exported meshes
+def get_export_images():
+    images = set()
+    for ob in bpy.context.scene.objects:
+        if ob.type != 'MESH':
+            continue
+        for mat_slot in ob.material_slots:
+            if mat_slot.material and mat_slot.material.use_nodes:
+                for n in mat_slot.material.node_tree.nodes:
+                    if n.type == "TEX_IMAGE" and n.image is not None:
+                        images.add(n.image)
+    return images
+
+def image_file_data(image):
+    if image.packed_file:
+        return image.packed_file.data
+    with open(bpy.path.abspath(image.filepath), 'rb') as f:
+        return f.read()
+
+# whether any pixel of the image is not fully opaque, reading its pixels
+def image_has_alpha(image):
+    import numpy
+
+    pixels = numpy.empty(len(image.pixels), dtype=numpy.float32)
+    image.pixels.foreach_get(pixels)
+    return bool((pixels[3::4] < 1.0).any())
+
+# replace images holding the same file as another one, with the same settings
+def deduplicate_images(images):
+    import hashlib
+
+    kept = {}
+    for image in sorted(images, key=lambda image: image.name):
+        if image.source != 'FILE':
+            continue
+        try:
+            key = (hashlib.sha1(image_file_data(image)).hexdigest(),
+                   image.colorspace_settings.name, image.alpha_mode)
+        except OSError:
+            continue
+        if key in kept:
+            image.user_remap(kept[key])
+            images.discard(image)
+            bpy.data.images.remove(image)
+        else:
+            kept[key] = image
+
+# original file of each image with its format, size and whether it has an
+# alpha channel, read from the file header without loading the pixels.
+# Packed images are written to the texture directory
+def read_texture_sources(images, texture_dir):
+    sources = {}
+    for i, image in enumerate(sorted(images, key=lambda image: image.name)):
+        if image.source != 'FILE':
+            continue
+        try:
+            if image.packed_file:
+                path = os.path.join(texture_dir, "source-{}".format(i))
+                with open(path, 'wb') as f:
+                    f.write(image.packed_file.data)
+            else:
+                path = bpy.path.abspath(image.filepath)
+            with open(path, 'rb') as f:
+                header = f.read(IMAGE_HEADER_SIZE)
+        except OSError as e:
+            print("Failed to read {}: {}".format(image.name, e))
+            continue
+
+        size = gltf_utils.read_image_size(header) or tuple(image.size)
+        if not all(size):
+            continue
+        alpha = gltf_utils.read_image_alpha(header)
+        if alpha is None:
+            alpha = image.alpha_mode != 'NONE'
+        sources[image] = {
+            'index': i,
+            'path': path,
+            'file_size': os.path.getsize(path),
+            'file_format': image.file_format,
+            'size': tuple(size),
+            'alpha': alpha,
+            'alpha_checked': not alpha,
+            # Normal, roughness and other data maps don't survive JPEG artifacts
+            'data': image.colorspace_settings.is_data or image.colorspace_settings.name == 'Non-Color',
+            # Format and size of the file the image currently uses
+            'output': (image.file_format, tuple(size)),
+        }
+    return sources
+
+# format the image is exported in, JPEG being only used for opaque color images
+def texture_file_format(source, jpeg):
+    if jpeg and not source['alpha'] and not source['data']:
+        return 'JPEG'
+    return source['file_format'] if source['file_format'] in ('PNG', 'JPEG') else 'PNG'
+
+def texture_size(source, max_size):
+    return image_utils.fit_size(source['size'], max_size) if max_size else source['size']
+
+# resolution cap and JPEG use for the export settings and given reductions
+def texture_settings(export_settings, reductions):
+    sizes = [size for size in (export_settings.get('max_texture_size', 0), reductions.get('texture_size', 0)) if size]
+    jpeg = export_settings.get('optimize_textures', False) or reductions.get('jpeg', False)
+    return min(sizes, default=0), jpeg
+
+# estimate the size of the exported meshes, evaluating each object once
+def estimate_geometry_size():
+    import numpy
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    geometry = 0
+    for ob in bpy.context.scene.objects:
+        if ob.type != 'MESH':
+            continue
+        mesh = ob.evaluated_get(depsgraph).data
+        loop_totals = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+        mesh.polygons.foreach_get('loop_total', loop_totals)
+        # Vertices are split per face corner at worst, with a position,
+        # normal and UV, and each triangle takes 3 indices
+        triangles = int(loop_totals.sum()) - 2 * len(loop_totals)
+        geometry += len(mesh.loops) * 32 + triangles * 12
+    return geometry
+
+# estimate the size of the GLB exported with the given reductions, from
+# the size of the meshes given by estimate_geometry_size
+def estimate_glb_size(export_settings, geometry, sources, reductions):
+    if reductions.get('draco'):
+        geometry *= DRACO_RATIO
+
+    max_size, jpeg = texture_settings(export_settings, reductions)
+    textures = 0
+    for source in sources.values():
+        size = source['file_size'] * (max(texture_size(source, max_size)) / max(source['size'])) ** 2
+        if source['file_format'] != 'JPEG' and texture_file_format(source, jpeg) == 'JPEG':
+            size *= JPEG_RATIO
+        textures += size
+
+    return int(geometry + textures)
+
+# scale down and re-encode the images, always from their original file so
+# that stronger reductions don't encode them again from a lossy copy, then
+# point the images to the new files
+def optimize_textures(sources, max_size, jpeg, texture_dir):
+    jobs = []
+    targets = {}
+    for image, source in sources.items():
+        file_format = texture_file_format(source, jpeg)
+        size = texture_size(source, max_size)
+        if (file_format, size) == source['output']:
+            continue
+        dst = os.path.join(texture_dir, "{}-{}-{}.{}".format(
+            bpy.path.clean_name(image.name), source['index'], max(size), 'jpg' if file_format == 'JPEG' else 'png'))
+        jobs.append((source['path'], dst, file_format))
+        targets[dst] = (image, file_format, size)
+
+    results = image_utils.convert_image_files(jobs, max_size) if jobs else {}
+    for dst, result in results.items():
+        image, file_format, size = targets[dst]
+        if isinstance(result, Exception):
+            print("Failed to optimize {}: {}".format(image.name, result))
+            continue
+        if image.packed_file:
+            image.unpack(method='REMOVE')
+        image.filepath = dst
+        image.file_format = file_format
+        image.reload()
+        sources[image]['output'] = (file_format, size)
+
+    # Images with an alpha channel may still be opaque, which is only known
+    # from their pixels, read once they are small enough
+    if jpeg:
+        opaque = False
+        for image, source in sources.items():
+            if source['alpha_checked'] or source['data'] or max(source['output'][1]) > ALPHA_CHECK_MAX_SIZE:
+                continue
+            source['alpha_checked'] = True
+            if not image_has_alpha(image):
+                source['alpha'] = False
+                opaque = True
+        if opaque:
+            optimize_textures(sources, max_size, jpeg, texture_dir)
+
+def describe_reductions(reductions):
+    applied = []
+    if reductions.get('draco'):
+        applied.append("Draco mesh compression")
+    if reductions.get('texture_size'):
+        applied.append("textures capped to {}px".format(reductions['texture_size']))
+    if reductions.get('jpeg'):
+        applied.append("opaque color textures as JPEG")
+    return applied
+
+# export the GLB with the least reductions keeping it within the size limit,
+# exporting again with stronger ones if the estimate was too optimistic
+def export_glb_within_limit(export_settings, tempdir, timings):
+    images = get_export_images()
+    if export_settings.get('optimize_textures', False):
+        report_progress("Optimizing textures")
+        start = time.perf_counter()
+        deduplicate_images(images)
+        timings['textures'] = time.perf_counter() - start
+
+    size_limit = export_settings.get('size_limit', 0)
+    levels = SIZE_REDUCTIONS if size_limit else SIZE_REDUCTIONS[:1]
+    size_limit -= THUMBNAIL_ALLOWANCE
+
+    # Only write and read the image files when they may be changed
+    sources = {}
+    texture_dir = os.path.join(tempdir, "textures")
+    if len(levels) > 1 or any(texture_settings(export_settings, {})):
+        os.makedirs(texture_dir, exist_ok=True)
+        sources = read_texture_sources(images, texture_dir)
+
+    level = 0
+    if len(levels) > 1:
+        geometry = estimate_geometry_size()
+        while level < len(levels) - 1 and estimate_glb_size(export_settings, geometry, sources, levels[level]) > size_limit:
+            level += 1
+
+    while True:
+        reductions = levels[level]
+        max_size, jpeg = texture_settings(export_settings, reductions)
+        if max_size or jpeg:
+            report_progress("Optimizing textures")
+            start = time.perf_counter()
+            optimize_textures(sources, max_size, jpeg, texture_dir)
+            timings['textures'] = timings.get('textures', 0.0) + time.perf_counter() - start
+            report_progress("Exporting GLB")
+
+        filepath, filename = export_glb(export_settings, tempdir, reductions)
+        size = os.path.getsize(filepath)
+        if size <= size_limit or level == len(levels) - 1:
+            break
+        print("Exported GLB is {} bytes, over the limit of {}: trying stronger reductions".format(size, size_limit))
+        os.remove(filepath)
+        level += 1
+
+    applied = describe_reductions(reductions)
+    if applied:
+        print("Reduced to fit the upload limit: " + ", ".join(applied))
+    return filepath, filename, applied
+
+# export the GLB while the thumbnail renders, then zip both
+def save_glb(export_settings, tempdir, timings):
+    thumbnail_process = None
+    if export_settings.get('thumbnail_mode') == 'FILE':
+        thumbnail_path = render_thumbnail(export_settings, tempdir)
+        report_progress("Exporting GLB")
+    else:
+        thumbnail_start = time.perf_counter()
+        thumbnail_process = start_thumbnail_process(tempdir)
+        report_progress("Exporting GLB and rendering thumbnail")
 
-    # Zip the GLB file and thumbnail
-    zip_filepath = filepath + ".zip"
-    with zipfile.ZipFile(zip_filepath, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        zipf.write(filepath, filename)
-        if os.path.exists(thumbnail_path):
-            zipf.write(thumbnail_path, "thumbnail.png")
-    zip_filename = os.path.basename(zip_filepath)
+    # Export as GLB
+    start = time.perf_counter()
+    try:
+        filepath, filename, reductions = export_glb_within_limit(export_settings, tempdir, timings)
+    except:
+        # Don't leave the render running after a failed export
+        if thumbnail_process is not None:
+            thumbnail_process.kill()
+            thumbnail_process.wait()
+            report_child('exit', thumbnail_process)
+        raise
+    timings['glb'] = time.perf_counter() - start - timings.get('textures', 0.0)
+
+    if thumbnail_process is not None:
+        if thumbnail_process.poll() is None:
+            report_progress("Rendering thumbnail")
+        thumbnail_process.wait()
+        report_child('exit', thumbnail_process)
+        timings['thumbnail'] = time.perf_counter() - thumbnail_start
+        thumbnail_path = os.path.join(tempdir, "thumbnail.png")
+        if thumbnail_process.returncode != 0:
+            print("Thumbnail render failed")
+            thumbnail_path = None
+
+    # Describe the zip of the GLB file and thumbnail, which is streamed
+    # from them on upload instead of being written
+    report_progress("Packing")
+    start = time.perf_counter()
+    files = [(filepath, filename)]
+    if thumbnail_path and os.path.exists(thumbnail_path):
+        files.append((thumbnail_path, os.path.basename(thumbnail_path)))
+    members = [zip_stream.scan_member(path, name) for path, name in files]
+    zip_filename = filename + ".zip"
+    timings['packing'] = time.perf_counter() - start
     print("----------------------------------")
-    print("Packed file: ", zip_filepath)
+    print("Packed members: " + ", ".join("{} ({})".format(m['name'], 'deflated' if m['method'] else 'stored') for m in members))
+    print("Timings: " + ", ".join("{} {:.2f}s".format(stage, t) for stage, t in timings.items()))
     print("----------------------------------")
-    size = os.path.getsize(zip_filepath)
+    size = zip_stream.zip_size(members)
 
-    return (zip_filepath, zip_filename, size)
+    return (members, zip_filename, size, reductions)
 
 # change visibility statuses and pack images
-def prepare_assets(export_settings):
+def prepare_assets(export_settings, pack_images=True):
     hidden = set()
     images = set()
 
@@ -137,7 +532,7 @@ def prepare_assets(export_settings):
                     ob.hide_set(True)
                     hidden.add(ob)
 
-    for img in images:
+    for img in images if pack_images else ():
         if not img.packed_file:
             try:
                 img.pack()
@@ -160,28 +555,45 @@ def prepare_assets(export_settings):
         if t.users == 0:
             bpy.data.images.remove(t)
 
-def prepare_file(export_settings):
+def prepare_file(export_settings, tempdir, timings):
+    report_progress("Preparing assets")
+    start = time.perf_counter()
     prepare_assets(export_settings)
-    return save_glb(export_settings)
+    timings['prepare'] = time.perf_counter() - start
+    return save_glb(export_settings, tempdir, timings)
 
-def read_settings():
-    with open(ICOSA_EXPORT_DATA_FILE, 'r') as s:
+def read_settings(tempdir):
+    with open(os.path.join(tempdir, ICOSA_EXPORT_DATA_FILENAME), 'r') as s:
         return json.load(s)
 
-def write_result(filepath, filename, size):
-    with open(ICOSA_EXPORT_DATA_FILE, 'w') as s:
+def write_result(tempdir, members, filename, size, reductions, timings):
+    with open(os.path.join(tempdir, ICOSA_EXPORT_DATA_FILENAME), 'w') as s:
         json.dump({
-                'filepath': filepath,
+                'members': members,
                 'filename': filename,
                 'size': size,
+                'reductions': reductions,
+                'timings': timings,
                 }, s)
 
-        
+# export the currently opened file, the settings and result being
+# exchanged through the JSON file of the temporary directory
+def run_export(tempdir):
+    export_settings = read_settings(tempdir)
+    timings = {}
+    members, filename, size, reductions = prepare_file(export_settings, tempdir, timings)
+    write_result(tempdir, members, filename, size, reductions, timings)
+
+
 if __name__ == "__main__":
     try:
-        export_settings = read_settings()
-        filepath, filename, size = prepare_file(export_settings)
-        write_result(filepath, filename, size)
+        args = sys.argv[sys.argv.index("--") + 1:]
+        if "--thumbnail" in args:
+            export_settings = read_settings(args[0])
+            prepare_assets(export_settings, pack_images=False)
+            render_thumbnail(export_settings, args[0])
+        else:
+            run_export(args[0])
     except:
         import traceback
         traceback.print_exc()
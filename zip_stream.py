@@ -0,0 +1,198 @@
+"""
+Copyright 2025 Icosa Foundation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Zip packages streamed from their member files, without writing the zip
+
+The members are scanned once when packaging, for their CRC and sizes, so
+that the headers can be written up front and the length of the whole zip
+is known before sending it. Members which compress well are deflated to a
+side file, the others are stored as they are.
+"""
+
+import os
+import struct
+import time
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+# Members are deflated when a sample of them compresses below this ratio
+DEFLATE_RATIO = 0.9
+SAMPLE_SIZE = 4 * 1024 * 1024
+DEFLATE_LEVEL = 6
+
+STORED = 0
+DEFLATED = 8
+# Bit 11: names are UTF-8
+UTF8_FLAG = 0x800
+VERSION = 20
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+# No Zip64 support, which uploads never need
+MAX_SIZE = 0xFFFFFFFF
+
+
+def compression_ratio(path):
+    """Ratio of the deflated size of the beginning of the file to its size"""
+    with open(path, 'rb') as f:
+        sample = f.read(SAMPLE_SIZE)
+    if not sample:
+        return 1.0
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    return len(compressor.compress(sample) + compressor.flush()) / len(sample)
+
+
+def scan_member(path, name):
+    """
+    Describe a file to package, deflating it next to the original when it
+    compresses well, in which case the original is removed
+
+    Returns:
+        Dict member, holding the path of the data to send as is
+    """
+    member = {
+        'name': name,
+        'path': path,
+        'method': STORED,
+        'date_time': list(time.localtime(os.path.getmtime(path))[:6]),
+        'crc': 0,
+        'size': 0,
+        'compressed_size': 0,
+    }
+
+    deflate = compression_ratio(path) < DEFLATE_RATIO
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15) if deflate else None
+    deflated_path = path + '.deflate'
+    out = open(deflated_path, 'wb') if deflate else None
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                member['crc'] = zlib.crc32(chunk, member['crc'])
+                member['size'] += len(chunk)
+                if out is not None:
+                    out.write(compressor.compress(chunk))
+        if out is not None:
+            out.write(compressor.flush())
+    finally:
+        if out is not None:
+            out.close()
+
+    if deflate:
+        member['method'] = DEFLATED
+        member['path'] = deflated_path
+        member['compressed_size'] = os.path.getsize(deflated_path)
+        os.remove(path)
+    else:
+        member['compressed_size'] = member['size']
+
+    if member['size'] > MAX_SIZE or member['compressed_size'] > MAX_SIZE:
+        raise ValueError("{} is too large to be packaged".format(name))
+    return member
+
+
+def dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (hour << 11 | minute << 5 | second // 2), ((max(year, 1980) - 1980) << 9 | month << 5 | day)
+
+
+def local_header(member):
+    name = member['name'].encode('utf-8')
+    dos_time, dos_date = dos_date_time(member['date_time'])
+    return LOCAL_HEADER.pack(
+        0x04034b50, VERSION, UTF8_FLAG, member['method'], dos_time, dos_date,
+        member['crc'], member['compressed_size'], member['size'], len(name), 0) + name
+
+
+def central_directory(members):
+    records = []
+    offset = 0
+    for member in members:
+        name = member['name'].encode('utf-8')
+        dos_time, dos_date = dos_date_time(member['date_time'])
+        records.append(CENTRAL_HEADER.pack(
+            0x02014b50, VERSION, VERSION, UTF8_FLAG, member['method'], dos_time, dos_date,
+            member['crc'], member['compressed_size'], member['size'], len(name), 0, 0, 0, 0, 0,
+            offset) + name)
+        offset += LOCAL_HEADER.size + len(name) + member['compressed_size']
+
+    directory = b''.join(records)
+    return directory + END_OF_CENTRAL_DIRECTORY.pack(
+        0x06054b50, 0, 0, len(members), len(members), len(directory), offset, 0)
+
+
+def zip_size(members):
+    """Length of the zip of the members, see ZipStream"""
+    data = sum(LOCAL_HEADER.size + len(m['name'].encode('utf-8')) + m['compressed_size'] for m in members)
+    return data + len(central_directory(members))
+
+
+class ZipStream:
+    """
+    File-like zip of scanned members, reading their data in chunks
+
+    Args:
+        members: List of members returned by scan_member
+    """
+    def __init__(self, members):
+        self.parts = []
+        self.files = []
+        try:
+            for member in members:
+                self.parts.append(local_header(member))
+                f = open(member['path'], 'rb')
+                self.files.append(f)
+                self.parts.append(f)
+        except:
+            self.close()
+            raise
+        self.parts.append(central_directory(members))
+        self.length = zip_size(members)
+
+        self.index = 0
+        self.offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+
+        chunks = []
+        while size > 0 and self.index < len(self.parts):
+            part = self.parts[self.index]
+            if isinstance(part, bytes):
+                data = part[self.offset:self.offset + size]
+                self.offset += len(data)
+            else:
+                data = part.read(size)
+            if not data:
+                self.index += 1
+                self.offset = 0
+                continue
+            chunks.append(data)
+            size -= len(data)
+        return b''.join(chunks)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.files = []